@@ -0,0 +1,151 @@
+"""Common batched interface of the agents that play divide-the-dollar.
+
+An agent decides for many games at once: decide(agent_states, sim_states) takes one internal
+state per game (e.g. a BDA's current automaton state, 0 before its first decision) and one BDA
+sim_state row [card_showing, low_card, median_card, high_card, fraction_of_deals,
+first_player?] per game, and returns the action and the next internal state of every game.
+batch_policy(num_games) returns the equivalent policy callable for batch_game.play_games, and
+MixedPolicy plays a different agent in every game of one batch.
+"""
+from __future__ import division
+
+import numpy as np
+
+import batch_game
+import bda
+import hall_of_fame
+
+FRACTION_INPUT = 4  # sim_state input holding the fraction of rounds that were deals
+
+
+class BDAAgent(object):
+    """A BDA, or one member of a BDAPopulation, stepped through the vectorized population code.
+
+    Args:
+        agent (BDA or BDAPopulation): the automaton(s)
+        member (int): member of a BDAPopulation that plays
+
+    Attributes:
+        num_states (int): number of automaton states
+        uses_fraction (bool): whether any state tests the fraction of deals
+
+    """
+
+    def __init__(self, agent, member=0):
+        """Initialize adapter."""
+        if isinstance(agent, bda.BDA):
+            agent, member = bda.BDAPopulation.from_bdas([agent]), 0
+        self.population = agent
+        self.member = member
+        self.num_states = agent.num_states
+        self.uses_fraction = bool(np.any(agent.decision_index[member] == FRACTION_INPUT))
+
+    def decide(self, agent_states, sim_states):
+        """Return the action and next automaton state of every game."""
+        agent_states = np.array(agent_states, dtype=np.int64)
+        members = np.full(len(agent_states), self.member, dtype=np.int64)
+        return self.population.run_many(sim_states, agent_states, members), agent_states
+
+    def batch_policy(self, num_games):
+        return batch_game.PopulationPolicy(self.population,
+                                           np.full(num_games, self.member, dtype=np.int64))
+
+
+class PolicyAgent(object):
+    """A Monte Carlo optimal_policy over the game states of a game.CardGame (no internal state).
+
+    Args:
+        policy (array): action to take in each state index
+        card_game (CardGame): game whose state lookup maps hands to state indices
+
+    """
+
+    num_states = 1
+    uses_fraction = False
+
+    def __init__(self, policy, card_game):
+        """Initialize adapter."""
+        self.policy = policy
+        self.card_game = card_game
+
+    def decide(self, agent_states, sim_states):
+        """Return the action of every game; the internal state is unchanged."""
+        return self.batch_policy(len(sim_states))(sim_states), np.array(agent_states, dtype=np.int64)
+
+    def batch_policy(self, num_games):
+        return batch_game.MonteCarloPolicy(self.policy, self.card_game, num_games)
+
+
+def population_agents(population, members=None):
+    """Return a BDAAgent for each member of a BDAPopulation (all members by default)."""
+    members = xrange(population.pop_size) if members is None else members
+    return [BDAAgent(population, member) for member in members]
+
+
+def pool_bdas(players):
+    """Return players with all BDAAgents of equal size backed by one shared BDAPopulation.
+
+    MixedPolicy steps all agents of one population together, so pooling lets a batch of games
+    between hundreds of BDAs take one vectorized step per turn.
+    """
+    players = list(players)
+    by_size = {}
+    for i, player in enumerate(players):
+        if isinstance(player, BDAAgent):
+            by_size.setdefault(player.num_states, []).append(i)
+    for indices in by_size.values():
+        population = bda.BDAPopulation.from_records(np.concatenate(
+            [players[i].population.to_records([players[i].member]) for i in indices]))
+        for member, i in enumerate(indices):
+            players[i] = BDAAgent(population, member)
+    return players
+
+
+class MixedPolicy(object):
+    """Batch policy where game g is played by players[members[g]].
+
+    BDAAgents backed by the same BDAPopulation are stepped with one PopulationPolicy; every
+    other agent gets its own batch_policy over its games.
+
+    Args:
+        players (list): agents
+        members (array): index into players of the agent playing each game
+
+    """
+
+    def __init__(self, players, members):
+        """Group the games by the policy that plays them."""
+        members = np.asarray(members)
+        self.num_games = len(members)
+        self.groups = []
+        populations = {}
+        for index in np.unique(members):
+            player = players[index]
+            if isinstance(player, BDAAgent):
+                populations.setdefault(id(player.population), (player.population, []))[1].append(index)
+            else:
+                rows = np.flatnonzero(members == index)
+                self.groups.append((rows, player.batch_policy(len(rows))))
+        for population, indices in populations.values():
+            rows = np.flatnonzero(np.isin(members, indices))
+            member_of = np.zeros(len(players), dtype=np.int64)
+            member_of[indices] = [players[index].member for index in indices]
+            self.groups.append((rows, batch_game.PopulationPolicy(population, member_of[members[rows]])))
+
+    def __call__(self, sim_states):
+        """Return the action each game's agent takes in its sim_state."""
+        actions = np.empty(self.num_games, dtype=np.int64)
+        for rows, policy in self.groups:
+            actions[rows] = policy(sim_states[rows])
+        return actions
+
+
+def load_bdas(path, size=None):
+    """Return BDAAgents of the genomes in a population, archive or hall-of-fame .npy file."""
+    return population_agents(bda.BDAPopulation.from_records(hall_of_fame.read_genomes(path, size)))
+
+
+def load_policy(path, card_game):
+    """Return the PolicyAgent of the optimal_policy in a mc.MonteCarloLearning checkpoint."""
+    with np.load(path) as checkpoint:
+        return PolicyAgent(checkpoint['optimal_policy'], card_game)
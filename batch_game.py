@@ -0,0 +1,525 @@
+"""Batched divide-the-dollar engine: many independent games played in lockstep.
+
+Hands are stored as per-value card counts of shape (num_games, num_cards), decks as
+(num_games, deck_size) arrays of card indices and scores as (num_games,) arrays, so every
+card move in every game is a masked array operation instead of an np.delete/np.sort call.
+"""
+from __future__ import division
+
+import numpy as np
+
+import bda
+import instrument
+
+SMALL_SPOIL = 0
+MEDIAN = 1
+LARGE_MAX = 2
+
+
+def shuffled_decks(num_games, num_of_unique_cards, rng=np.random):
+    """Return one independently shuffled deck per game.
+
+    Args:
+        num_games (int): number of decks to shuffle
+        num_of_unique_cards (list): total number of each of the unique cards
+        rng (RandomState): source of randomness (defaults to the global numpy state)
+
+    Returns:
+        (array): (num_games, deck_size) uint8 array of card indices
+
+    """
+    deck = np.repeat(np.arange(len(num_of_unique_cards), dtype=np.uint8), num_of_unique_cards)
+    order = np.argsort(rng.random_sample((num_games, len(deck))), axis=1)
+    return deck[order]
+
+
+def count_cards(card_indices, num_cards):
+    """Return (num_games, num_cards) per-value counts of a (num_games, k) block of cards."""
+    counts = np.empty((len(card_indices), num_cards), dtype=np.int64)
+    for card in xrange(num_cards):
+        counts[:, card] = (card_indices == card).sum(axis=1)
+    return counts
+
+
+def card_at(hands, position):
+    """Return index of the card at a (per-game) position of each sorted hand."""
+    return (np.cumsum(hands, axis=1) <= np.reshape(position, (-1, 1))).sum(axis=1)
+
+
+def hand_summary(hands, hand_size):
+    """Return (smallest, median, largest) card indices of each hand.
+
+    The median is the card at position hand_size // 2, matching the scalar drivers (which keep
+    using that position once the deck is empty and hands shrink).
+
+    """
+    smallest = card_at(hands, 0)
+    median = card_at(hands, hand_size // 2)
+    largest = card_at(hands, hands.sum(axis=1) - 1)
+    return smallest, median, largest
+
+
+def play_action_batch(card_showing, hands, player_actions, cards, hand_size):
+    """Play one card per game according to each player's chosen action.
+
+    Batched equivalent of divide_dollar_bda.play_action: a player going first plays its
+    smallest, median or largest card; a player going second either spoils with the smallest
+    card that pushes the total over 1.0 (largest card if it can't), plays the median, or
+    maximizes with the largest card that keeps the total within 1.0 (smallest if it can't).
+
+    Args:
+        card_showing (array): index of the card showing per game (len(cards) if none)
+        hands (array): (num_games, num_cards) card counts, updated in place
+        player_actions (array): action index per game
+        cards (list): value of each unique card
+        hand_size (int): number of cards in a full hand
+
+    Returns:
+        (tuple): updated card_showing and index of the card played, per game
+
+    """
+    num_cards = len(cards)
+    rows = np.arange(len(hands))
+    smallest, median, largest = hand_summary(hands, hand_size)
+    played = median.copy()
+
+    first = card_showing == num_cards
+    spoil = player_actions == SMALL_SPOIL
+    maximize = player_actions == LARGE_MAX
+    played[first & spoil] = smallest[first & spoil]
+    played[first & maximize] = largest[first & maximize]
+
+    second = ~first
+    if second.any():
+        card_values = np.asarray(cards, dtype=float)
+        shown_value = np.append(card_values, 0.)[card_showing]
+        totals = card_values[np.newaxis, :] + shown_value[:, np.newaxis]
+        in_hand = hands > 0
+
+        can_spoil = in_hand & (totals > 1.0)
+        spoil_card = np.where(can_spoil.any(axis=1), can_spoil.argmax(axis=1), largest)
+        can_maximize = in_hand & (totals <= 1.0)
+        maximize_card = np.where(can_maximize.any(axis=1),
+                                 num_cards - 1 - can_maximize[:, ::-1].argmax(axis=1), smallest)
+
+        played[second & spoil] = spoil_card[second & spoil]
+        played[second & maximize] = maximize_card[second & maximize]
+
+    hands[rows, played] -= 1
+    return np.where(first, played, card_showing), played
+
+
+class BDAPolicy(object):
+    """Batch policy backed by a list of BDA objects.
+
+    The same BDA can play many games at once, so each game keeps its own automaton state.
+
+    Args:
+        agents (list): BDA objects
+        members (array): index into agents of the BDA playing each game
+
+    """
+
+    def __init__(self, agents, members):
+        """Initialize one automaton state per game."""
+        self.agents = agents
+        self.members = np.asarray(members)
+        self.current_states = np.zeros(len(self.members), dtype=np.int64)
+
+    def __call__(self, sim_states):
+        """Return the action each BDA takes in its game's sim_state."""
+        actions = np.empty(len(self.members), dtype=np.int64)
+        for g, (m, sim_state) in enumerate(zip(self.members, sim_states.tolist())):
+            agent = self.agents[m]
+            agent.current_state = self.current_states[g]
+            actions[g] = agent.run(sim_state)
+            self.current_states[g] = agent.current_state
+        return actions
+
+
+class PopulationPolicy(object):
+    """Batch policy backed by a bda.BDAPopulation; steps every game's automaton at once.
+
+    Args:
+        population (BDAPopulation): population of BDAs
+        members (array): population member playing each game
+
+    """
+
+    def __init__(self, population, members):
+        """Initialize one automaton state per game."""
+        self.population = population
+        self.members = np.asarray(members)
+        self.current_states = np.zeros(len(self.members), dtype=np.int64)
+
+    def __call__(self, sim_states):
+        """Return the action each BDA takes in its game's sim_state."""
+        return self.population.run_many(sim_states, self.current_states, self.members)
+
+
+class TablePolicy(object):
+    """Batch policy that looks BDA decisions up in precompiled decision tables.
+
+    Args:
+        tables (tuple): fractions, fraction classes, actions and transitions from
+            bda.BDAPopulation.decision_tables
+        members (array): row of the tables playing each game
+        cards (list): sorted value of each unique card the tables were compiled for
+
+    """
+
+    def __init__(self, tables, members, cards):
+        """Initialize one automaton state per game."""
+        self.fractions, self.fraction_class, self.actions, self.transitions = tables
+        self.members = np.asarray(members)
+        self.shown_values = np.append(0., cards)
+        self.current_states = np.zeros(len(self.members), dtype=np.int64)
+
+    def __call__(self, sim_states):
+        """Return the action each BDA takes in its game's sim_state."""
+        fraction_class = self.fraction_class[self.members, np.searchsorted(self.fractions, sim_states[:, 4])]
+        key = (self.members, self.current_states,
+               np.searchsorted(self.shown_values, sim_states[:, 0]),
+               sim_states[:, 1].astype(np.int64), sim_states[:, 2].astype(np.int64),
+               sim_states[:, 3].astype(np.int64), fraction_class,
+               sim_states[:, 5].astype(np.int64))
+        self.current_states = self.transitions[key].astype(np.int64)
+        return self.actions[key].astype(np.int64)
+
+
+class MonteCarloPolicy(object):
+    """Batch policy that plays a Monte Carlo optimal_policy, optionally recording trajectories.
+
+    Args:
+        policy (array): action to take in each state index; read at every decision, so
+            updates made by mc.MonteCarloLearning are picked up
+        card_game (CardGame): game whose state lookup maps hands to state indices
+        num_games (int): number of games in the batch
+        exploring_rounds (int): rounds at the start of each game played with a random action
+            (exploring starts)
+        record (bool): record the state seen and action taken on every turn
+        rng (RandomState): source of randomness for exploring starts
+
+    Attributes:
+        turn (int): number of turns played so far in the current batch
+        states_seen (array): (num_games, num_rounds) state index seen on each turn
+        actions_taken (array): (num_games, num_rounds) action taken on each turn
+
+    """
+
+    def __init__(self, policy, card_game, num_games, exploring_rounds=0, record=False,
+                 rng=np.random):
+        """Initialize policy and preallocate trajectory arrays."""
+        self.policy = policy
+        self.card_game = card_game
+        self.exploring_rounds = exploring_rounds
+        self.rng = rng
+        self.card_values = np.asarray(card_game.card_values, dtype=float)
+        self.turn = 0
+        self.states_seen = None
+        self.actions_taken = None
+        if record:
+            self.states_seen = np.empty((num_games, card_game.num_rounds), dtype=np.int64)
+            self.actions_taken = np.empty((num_games, card_game.num_rounds), dtype=np.int64)
+
+    def __call__(self, sim_states):
+        """Return the action to take in each game's sim_state."""
+        shown_value = sim_states[:, 0]
+        card_showing = np.searchsorted(self.card_values, shown_value)
+        card_showing[shown_value == 0] = len(self.card_values)
+        game_states = np.column_stack((card_showing, sim_states[:, 1:4].astype(np.int64)))
+        state_indices = self.card_game.state_indices(game_states)
+
+        if self.turn < self.exploring_rounds:
+            actions = self.rng.randint(0, self.card_game.num_actions, len(sim_states))
+        else:
+            actions = self.policy[state_indices]
+        if self.states_seen is not None:
+            self.states_seen[:, self.turn] = state_indices
+            self.actions_taken[:, self.turn] = actions
+        self.turn += 1
+        return actions
+
+
+def bda_policy(agents, members):
+    """Return the batch policy for a BDAPopulation or a list of BDA objects."""
+    if isinstance(agents, bda.BDAPopulation):
+        return PopulationPolicy(agents, members)
+    return BDAPolicy(agents, members)
+
+
+def play_games(decks, p1_policy, p2_policy, cards, hand_size):
+    """Play one game per deck between two batch policies.
+
+    Player 1 leads on even rounds, player 2 on odd rounds; after each round both players pick
+    up a card while the deck lasts. A policy is called with a (num_games, 6) array of BDA
+    sim_states [card_showing, low_card, median_card, high_card, fraction_of_deals,
+    first_player?] and returns one action per game.
+
+    Args:
+        decks (array): (num_games, deck_size) shuffled card indices
+        p1_policy (callable): batch policy of player 1
+        p2_policy (callable): batch policy of player 2
+        cards (list): value of each unique card
+        hand_size (int): number of cards in a player's hand
+
+    Returns:
+        (tuple): total score of player 1 and player 2 in each game
+
+    """
+    num_games, deck_size = decks.shape
+    num_cards = len(cards)
+    num_rounds = 1 + (deck_size - 2 * hand_size) // 2
+    rows = np.arange(num_games)
+    shown_values = np.append(np.asarray(cards, dtype=float), 0.)
+
+    with instrument.timer('deal'):
+        hands = (count_cards(decks[:, :hand_size], num_cards),
+                 count_cards(decks[:, hand_size:2 * hand_size], num_cards))
+    policies = (p1_policy, p2_policy)
+    scores = (np.zeros(num_games), np.zeros(num_games))
+    num_deals = np.zeros(num_games, dtype=np.int64)
+    next_card = 2 * hand_size
+    sim_states = np.empty((num_games, 6))
+
+    for round_index in xrange(num_rounds):
+        card_showing = np.full(num_games, num_cards, dtype=np.int64)
+        card_values = [None, None]
+        for turn, player in enumerate((0, 1) if round_index % 2 == 0 else (1, 0)):
+            smallest, median, largest = hand_summary(hands[player], hand_size)
+            sim_states[:, 0] = shown_values[card_showing]
+            sim_states[:, 1] = smallest
+            sim_states[:, 2] = median
+            sim_states[:, 3] = largest
+            sim_states[:, 4] = num_deals / (round_index + 1)
+            sim_states[:, 5] = turn
+            with instrument.timer('bda_decision'):
+                player_actions = policies[player](sim_states)
+            with instrument.timer('card_play'):
+                card_showing, played = play_action_batch(card_showing, hands[player],
+                                                         player_actions, cards, hand_size)
+            card_values[player] = shown_values[played]
+
+        # Both players score only if the cards played don't exceed the dollar
+        deal = card_values[0] + card_values[1] <= 1
+        scores[0][deal] += card_values[0][deal]
+        scores[1][deal] += card_values[1][deal]
+        num_deals += deal
+
+        with instrument.timer('deal'):
+            for player in (0, 1):
+                if next_card < deck_size:
+                    hands[player][rows, decks[:, next_card]] += 1
+                    next_card += 1
+
+    return scores
+
+
+def match_stats(p1_members, p2_members, p1_scores, p2_scores, num_agents):
+    """Accumulate per-agent score-keeping over a batch of finished games.
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays of length num_agents
+
+    """
+    p1_won = p1_scores > p2_scores
+    p2_won = p2_scores > p1_scores
+    wins = (np.bincount(p1_members, p1_won, num_agents)
+            + np.bincount(p2_members, p2_won, num_agents)).astype(np.int64)
+    losses = (np.bincount(p1_members, p2_won, num_agents)
+              + np.bincount(p2_members, p1_won, num_agents)).astype(np.int64)
+    score_earned = (np.bincount(p1_members, p1_scores, num_agents)
+                    + np.bincount(p2_members, p2_scores, num_agents))
+    score_diff = (np.bincount(p1_members, p1_scores - p2_scores, num_agents)
+                  + np.bincount(p2_members, p2_scores - p1_scores, num_agents))
+    return wins, losses, wins - losses, score_earned, score_diff
+
+
+def expected_stats(p1_members, p2_members, p1_wins, p2_wins, p1_scores, p2_scores, num_agents):
+    """Accumulate per-agent score-keeping from (expected) totals of whole matchups.
+
+    Like match_stats, but every row holds the wins and scores of both players over a number of
+    games (or their expected values) instead of one game's scores.
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays of length num_agents
+
+    """
+    wins = (np.bincount(p1_members, p1_wins, num_agents)
+            + np.bincount(p2_members, p2_wins, num_agents))
+    losses = (np.bincount(p1_members, p2_wins, num_agents)
+              + np.bincount(p2_members, p1_wins, num_agents))
+    score_earned = (np.bincount(p1_members, p1_scores, num_agents)
+                    + np.bincount(p2_members, p2_scores, num_agents))
+    score_diff = (np.bincount(p1_members, p1_scores - p2_scores, num_agents)
+                  + np.bincount(p2_members, p2_scores - p1_scores, num_agents))
+    return wins, losses, wins - losses, score_earned, score_diff
+
+
+def matchup_members(p1_agents, p2_agents, num_episodes):
+    """Return per-game (p1, p2) agent indices for every p1 vs every p2, num_episodes each."""
+    p1_agents = np.asarray(p1_agents)
+    p2_agents = np.asarray(p2_agents)
+    p1_members = np.repeat(p1_agents, len(p2_agents) * num_episodes)
+    p2_members = np.tile(np.repeat(p2_agents, num_episodes), len(p1_agents))
+    return p1_members, p2_members
+
+
+def play_matchups(agents, p1_members, p2_members, num_of_unique_cards, cards, hand_size,
+                  rng=np.random, decks=None):
+    """Play one game per (p1_members[g], p2_members[g]) pair on freshly shuffled decks.
+
+    agents may be a bda.BDAPopulation or a list of BDA objects. Game g is played on decks[g]
+    if decks are given.
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays over all agents
+
+    """
+    if decks is None:
+        with instrument.timer('shuffle'):
+            decks = shuffled_decks(len(p1_members), num_of_unique_cards, rng)
+    p1_scores, p2_scores = play_games(decks, bda_policy(agents, p1_members),
+                                      bda_policy(agents, p2_members), cards, hand_size)
+    if instrument.profile is not None:
+        instrument.profile.count('games', len(p1_members))
+    num_agents = agents.pop_size if isinstance(agents, bda.BDAPopulation) else len(agents)
+    with instrument.timer('stats'):
+        return match_stats(p1_members, p2_members, p1_scores, p2_scores, num_agents)
+
+
+def round_robin(agents, pop_size, rand_pop_size, num_episodes, num_of_unique_cards, cards,
+                hand_size, rng=np.random):
+    """Play every evolving agent against every random agent, num_episodes games each.
+
+    Agents [0, pop_size) always sit as player 1 and agents [pop_size, pop_size+rand_pop_size)
+    as player 2, with a freshly shuffled deck for every game, like the serial round-robin.
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays over all agents
+
+    """
+    p1_members, p2_members = matchup_members(np.arange(pop_size),
+                                             np.arange(pop_size, pop_size + rand_pop_size),
+                                             num_episodes)
+    return play_matchups(agents, p1_members, p2_members, num_of_unique_cards, cards, hand_size,
+                         rng)
+
+
+def crn_round_robin(agents, pop_size, rand_pop_size, num_episodes, num_of_unique_cards, cards,
+                    hand_size, swap_seats=True, rng=np.random):
+    """Round-robin on common random numbers: every matchup replays the same num_episodes decks.
+
+    One (num_episodes, deck_size) bank of shuffled decks is drawn per call and replayed for
+    every (evolving, random) matchup, so differences between agents' results come from their
+    play rather than from their deals. With swap_seats, every deck is also played with the
+    random agent as player 1, and the statistics are averaged over both seatings (so they stay
+    on the scale of num_episodes games per matchup, like round_robin).
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays over all agents
+
+    """
+    with instrument.timer('shuffle'):
+        bank = shuffled_decks(num_episodes, num_of_unique_cards, rng)
+    p1_members, p2_members = matchup_members(np.arange(pop_size),
+                                             np.arange(pop_size, pop_size + rand_pop_size),
+                                             num_episodes)
+    decks = bank[np.tile(np.arange(num_episodes), pop_size * rand_pop_size)]
+    if not swap_seats:
+        return play_matchups(agents, p1_members, p2_members, num_of_unique_cards, cards, hand_size,
+                             decks=decks)
+    stats = play_matchups(agents, np.concatenate((p1_members, p2_members)),
+                          np.concatenate((p2_members, p1_members)), num_of_unique_cards, cards,
+                          hand_size, decks=np.concatenate((decks, decks)))
+    return tuple(stat / 2 for stat in stats)
+
+
+def wilson_interval(points, games, z=1.96):
+    """Return the Wilson score interval of win rates points / games.
+
+    Args:
+        points (array): wins (plus half of any ties counted) behind each rate
+        games (array): games behind each rate
+        z (float): normal quantile of the bound (1.96 = 95% confidence)
+
+    Returns:
+        (tuple): lower and upper bound arrays
+
+    """
+    games = np.maximum(games, 1)
+    rate = points / games
+    center = (rate + z**2 / (2 * games)) / (1 + z**2 / games)
+    half_width = (z * np.sqrt(rate * (1 - rate) / games + z**2 / (4 * games**2))
+                  / (1 + z**2 / games))
+    return center - half_width, center + half_width
+
+
+def adaptive_round_robin(agents, pop_size, rand_pop_size, num_episodes, min_episodes,
+                         max_episodes, top_k, num_of_unique_cards, cards, hand_size,
+                         tolerance=0.05, z=1.96, rng=np.random):
+    """Round-robin that keeps playing an evolving agent only while its rank is in doubt.
+
+    Every evolving agent first plays min_episodes games against each random opponent. After
+    each step the Wilson intervals of the agents' win rates decide which agents are done: those
+    surely among the top_k evolving agents (fewer than top_k others can beat their lower bound
+    by more than tolerance) or surely not (top_k others are surely better, up to tolerance).
+    The better half of the undecided agents (by estimated win rate) then plays min_episodes more
+    games against each opponent, in one batch, and so on (successive halving) until no agent is
+    left or max_episodes games per opponent are reached. Games go to the agents that may become
+    parents, and a step costs at most half of the one before it.
+
+    Every agent plays the same number of games against each opponent, and the statistics of
+    every matchup are its per-game averages scaled to num_episodes games, so the totals are
+    comparable with round_robin.
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays over all agents,
+            and the number of games played in each matchup as a (pop_size, rand_pop_size) array
+
+    """
+    if min_episodes < 1 or max_episodes < 1:
+        raise ValueError('min_episodes and max_episodes must be at least 1')
+    num_matchups = pop_size * rand_pop_size
+    p1_matchup = np.repeat(np.arange(pop_size), rand_pop_size)
+    p2_matchup = np.tile(np.arange(pop_size, pop_size + rand_pop_size), pop_size)
+    games = np.zeros(num_matchups)
+    totals = np.zeros((4, num_matchups))  # p1 wins, p2 wins, p1 score, p2 score
+
+    active = np.arange(pop_size)
+    while len(active):
+        episodes = int(min(min_episodes, max_episodes - games[active[0] * rand_pop_size]))
+        if episodes < 1:
+            break
+        matchups = np.repeat((active[:, None] * rand_pop_size + np.arange(rand_pop_size)).ravel(),
+                             episodes)
+        with instrument.timer('shuffle'):
+            decks = shuffled_decks(len(matchups), num_of_unique_cards, rng)
+        p1_scores, p2_scores = play_games(decks, bda_policy(agents, p1_matchup[matchups]),
+                                          bda_policy(agents, p2_matchup[matchups]), cards,
+                                          hand_size)
+        if instrument.profile is not None:
+            instrument.profile.count('games', len(matchups))
+
+        with instrument.timer('stats'):
+            for row, values in enumerate((p1_scores > p2_scores, p2_scores > p1_scores,
+                                          p1_scores, p2_scores)):
+                totals[row] += np.bincount(matchups, values, num_matchups)
+            games += np.bincount(matchups, minlength=num_matchups)
+
+            played = games.reshape(pop_size, rand_pop_size).sum(axis=1)
+            wins = totals[0].reshape(pop_size, rand_pop_size).sum(axis=1)
+            lower, upper = wilson_interval(wins, played, z)
+            others = ~np.eye(pop_size, dtype=bool)
+            may_beat = np.count_nonzero(others & (upper[None, :] > lower[:, None] + tolerance), axis=1)
+            surely_beaten = np.count_nonzero(others & (lower[None, :] > upper[:, None] - tolerance),
+                                             axis=1)
+            decided = (may_beat < top_k) | (surely_beaten >= top_k)
+            active = active[~decided[active] & (played[active] < max_episodes * rand_pop_size)]
+            rate = wins[active] / played[active]
+            active = active[np.argsort(-rate, kind='mergesort')[:(len(active) + 1) // 2]]
+
+    p1_wins, p2_wins, p1_score, p2_score = totals / games * num_episodes
+    num_agents = agents.pop_size if isinstance(agents, bda.BDAPopulation) else len(agents)
+    return expected_stats(p1_matchup, p2_matchup, p1_wins, p2_wins, p1_score, p2_score,
+                          num_agents) + (games.reshape(pop_size, rand_pop_size),)
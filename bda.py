@@ -3,11 +3,31 @@ from __future__ import division
 import random
 from io import StringIO
 
+import numpy as np
+
+import instrument
+
 NUM_ACTIONS = 3
 NUM_INPUTS = 6
 NUM_TESTS = 3
 NEAR = 0.05
 MAX_TRANSITIONS = 5
+GENOME_DTYPE = np.dtype([('decision_index', 'i1'), ('decision_type', 'i1'), ('actions', 'i1', (2,)),
+                         ('transitions', '<i2', (2,)), ('threshold', '<f8')]) # packed binary record of one state (16 bytes)
+MAX_RECORD_STATES = np.iinfo(np.int16).max + 1 # largest BDA whose transitions fit GENOME_DTYPE
+
+
+def check_genes(decision_index, decision_type, actions, transitions, num_states):
+    # The narrow GENOME_DTYPE integers would silently wrap out-of-range values
+    assert num_states <= MAX_RECORD_STATES, \
+        '%i states do not fit GENOME_DTYPE records (at most %i)' % (num_states, MAX_RECORD_STATES)
+    for name, values in (('decision_index', decision_index), ('decision_type', decision_type),
+                         ('actions', actions), ('transitions', transitions)):
+        values = np.asarray(values)
+        low, high = (0, num_states - 1) if name == 'transitions' else \
+            (np.iinfo(GENOME_DTYPE[name].base).min, np.iinfo(GENOME_DTYPE[name].base).max)
+        assert values.size == 0 or (values.min() >= low and values.max() <= high), \
+            '%s out of range [%i, %i]' % (name, low, high)
 
 
 class State(object):
@@ -37,30 +57,34 @@ class BDA(object):
     def reset(self):
         self.current_state = 0
 
-    def run(self, sim_state): # run on a given simulator state, return action
+    def decide(self, n, value): # outcome of state n's if statement on its input value
+        sdt = self.states[n].decision_type # state decision type
+        if sdt == 0:
+            return value > self.states[n].threshold_val
+        elif sdt == 1:
+            return value < self.states[n].threshold_val
+        elif sdt == 2:
+            return abs(value - self.states[n].threshold_val) < NEAR
+        return False
+
+    def step(self, current_state, sim_state): # interpret one decision from current_state, return (action, new state)
         ## sim_state = [total_played, low_card, median_card, high_card, fraction_of_deals, first_player?]
         bd = 1  # binary decision (bd=0 means if statement is TRUE, bd=1 means if statement is FALSE)
         it = 0 # number of internal transitions
         while bd == 1 and it <= MAX_TRANSITIONS:
-            cdv = self.states[self.current_state].decision_index # index of current decision variable
-            sdt = self.states[self.current_state].decision_type # state decision type
-            if sdt == 0:
-                if sim_state[cdv] > self.states[self.current_state].threshold_val:
-                    bd = 0
-                    break
-            elif sdt == 1:
-                if sim_state[cdv] < self.states[self.current_state].threshold_val:
-                    bd = 0
-                    break
-            elif sdt == 2:
-                if abs(sim_state[cdv] - self.states[self.current_state].threshold_val) < NEAR:
-                    bd = 0
-                    break
-            self.current_state = self.states[self.current_state].transitions[bd]
+            cdv = self.states[current_state].decision_index # index of current decision variable
+            if self.decide(current_state, sim_state[cdv]):
+                bd = 0
+                break
+            current_state = self.states[current_state].transitions[bd]
             it += 1
 
-        return_action = self.states[self.current_state].actions[bd]
-        self.current_state = self.states[self.current_state].transitions[bd] # transition to new state
+        if instrument.profile is not None:
+            instrument.profile.count_transitions(it, bd == 1)
+        return self.states[current_state].actions[bd], self.states[current_state].transitions[bd]
+
+    def run(self, sim_state): # run on a given simulator state, return action
+        return_action, self.current_state = self.step(self.current_state, sim_state) # transition to new state
 
         return return_action # tell user what the action to take is
 
@@ -118,13 +142,9 @@ class BDA(object):
 
     def write_bda(self):
         #output = '%i\n' % self.num_states
-        output = ''
-        for n in xrange(self.num_states):
-            output += '%i %i %.3f ' % (self.states[n].decision_index, self.states[n].decision_type, self.states[n].threshold_val)
-            for i in xrange(2):
-                output += '%i %i ' % (self.states[n].actions[i], self.states[n].transitions[i])
-            output += '\n'
-        return output
+        return ''.join(['%i %i %.3f %i %i %i %i \n' % (st.decision_index, st.decision_type, st.threshold_val,
+                                                      st.actions[0], st.transitions[0], st.actions[1], st.transitions[1])
+                        for st in self.states])
 
     def read_bda(self, bda_array):
         self.__init__(int(len(bda_array)))
@@ -137,6 +157,24 @@ class BDA(object):
             self.states[n].actions[1] = int(state_data[5])
             self.states[n].transitions[1] = int(state_data[6])
 
+    def to_records(self): # lossless packed form: one GENOME_DTYPE record per state
+        check_genes([st.decision_index for st in self.states], [st.decision_type for st in self.states],
+                    [st.actions for st in self.states], [st.transitions for st in self.states], self.num_states)
+        records = np.zeros(self.num_states, dtype=GENOME_DTYPE)
+        records['decision_index'] = [st.decision_index for st in self.states]
+        records['decision_type'] = [st.decision_type for st in self.states]
+        records['actions'] = [st.actions for st in self.states]
+        records['transitions'] = [st.transitions for st in self.states]
+        records['threshold'] = [st.threshold_val for st in self.states]
+        return records
+
+    def read_records(self, records): # overwrite this BDA from GENOME_DTYPE records
+        self.__init__(len(records))
+        for st, record in zip(self.states, records.tolist()):
+            st.decision_index, st.decision_type, actions, transitions, st.threshold_val = record
+            st.actions = list(actions)
+            st.transitions = list(transitions)
+
     def print_bda(self): # human-readable form
         action_text = ('SmlSpl', 'Median', 'LrgMax')
         input_text = ('Ttl', 'Sml', 'Med', 'Lrg', 'Coop', 'Idx')
@@ -147,3 +185,274 @@ class BDA(object):
             bda_output += '%i) if(%s %s %.3f) ' % (i, input_text[self.states[i].decision_index], decision_text[self.states[i].decision_type], self.states[i].threshold_val)
             bda_output += '%s-> %i else %s-> %i\n' % (action_text[self.states[i].actions[0]], self.states[i].transitions[0], action_text[self.states[i].actions[1]], self.states[i].transitions[1])
         return bda_output
+
+
+class BDAPopulation(object):
+    """Whole population of BDAs held as contiguous (pop_size, num_states) arrays.
+
+    Member i is equivalent to a BDA whose state n has decision_index[i, n], decision_type[i, n],
+    threshold_val threshold[i, n], actions actions[i, n] and transitions transitions[i, n].
+    Every operation works on many members at once, so no per-object Python state is touched.
+    """
+
+    def __init__(self, pop_size, ns):
+        self.pop_size = pop_size
+        self.num_states = ns
+        self.decision_index = np.zeros((pop_size, ns), dtype=np.int64)
+        self.decision_type = np.zeros((pop_size, ns), dtype=np.int64)
+        self.threshold = np.full((pop_size, ns), 0.5)
+        self.actions = np.zeros((pop_size, ns, 2), dtype=np.int64)
+        self.actions[:, :, 1] = -1
+        self.transitions = np.zeros((pop_size, ns, 2), dtype=np.int64)
+
+    def _members(self, members):
+        if members is None:
+            return np.arange(self.pop_size)
+        return np.atleast_1d(np.asarray(members, dtype=np.int64))
+
+    def randomize(self, members=None, rng=np.random):
+        m = self._members(members)
+        shape = (len(m), self.num_states)
+        self.decision_index[m] = rng.randint(0, NUM_INPUTS, shape)
+        self.decision_type[m] = rng.randint(0, NUM_TESTS, shape)
+        self.threshold[m] = rng.randint(0, 1001, shape)/1000
+        self.actions[m] = rng.randint(0, NUM_ACTIONS, shape + (2,))
+        self.transitions[m] = rng.randint(0, self.num_states, shape + (2,))
+
+    def run_many(self, sim_states, current_states, members=None):
+        """Step many automata at once; same semantics as BDA.run.
+
+        Args:
+            sim_states (array): (n, NUM_INPUTS) simulator states
+            current_states (array): (n,) current state of each automaton, updated in place
+            members (array): population member run on each row (defaults to row i -> member i)
+
+        Returns:
+            (array): action chosen by each automaton
+
+        """
+        m = self._members(members)
+        profile = instrument.profile
+        states = current_states
+        bd = np.ones(len(m), dtype=np.int64)  # 0 once a test is TRUE, 1 while all tests are FALSE
+        pending = np.arange(len(m))
+        for it in xrange(MAX_TRANSITIONS+1):
+            pm = m[pending]
+            ps = states[pending]
+            cdv = self.decision_index[pm, ps]
+            sdt = self.decision_type[pm, ps]
+            val = self.threshold[pm, ps]
+            x = sim_states[pending, cdv]
+            true = np.where(sdt == 0, x > val, np.where(sdt == 1, x < val, np.abs(x - val) < NEAR))
+            bd[pending[true]] = 0
+            if profile is not None:
+                profile.count_transitions(it, False, np.count_nonzero(true))
+            pending = pending[~true]
+            if len(pending) == 0:
+                break
+            states[pending] = self.transitions[m[pending], states[pending], 1]
+        if profile is not None and len(pending) > 0:
+            profile.count_transitions(MAX_TRANSITIONS+1, True, len(pending))
+
+        return_actions = self.actions[m, states, bd]
+        states[:] = self.transitions[m, states, bd] # transition to new states
+        return return_actions
+
+    def decision_tables(self, cards, num_rounds, members=None):
+        """Precompute run_many for every automaton state and every input of a game.
+
+        A game's inputs are finite: card showing (0 or a card value), low/median/high card
+        indices, fraction of deals k/(r+1) for rounds r < num_rounds and the first player flag.
+        The fractions are grouped per member into classes that every fraction-testing state
+        treats the same way, so the tables hold one entry per class instead of one per fraction.
+
+        Returns:
+            (tuple): sorted fraction-of-deals values, the (len(members), len(fractions)) class
+                of each fraction per member, and the action and next state arrays of shape
+                (len(members), num_states, len(cards)+1, len(cards), len(cards), len(cards),
+                num_classes, 2), indexed by member, state, card showing (0 for none, i+1 for
+                cards[i]), low, median, high, fraction class and first flag
+
+        """
+        m = self._members(members)
+        num_cards = len(cards)
+        fractions = np.unique([k/(r+1) for r in xrange(num_rounds) for k in xrange(r+1)])
+        fraction_class = np.empty((len(m), len(fractions)), dtype=np.int16)
+        representatives = []
+        for i, member in enumerate(m):
+            tests = self.decision_index[member] == 4
+            sdt = self.decision_type[member, tests]
+            val = self.threshold[member, tests]
+            x = fractions[:, None]
+            signatures = np.where(sdt == 0, x > val, np.where(sdt == 1, x < val, np.abs(x - val) < NEAR))
+            classes = {}
+            for f, signature in enumerate(map(tuple, signatures)):
+                fraction_class[i, f] = classes.setdefault(signature, len(classes))
+            representatives.append(fractions[np.unique(fraction_class[i], return_index=True)[1]])
+        num_classes = max(len(r) for r in representatives)
+
+        dims = (num_cards+1, num_cards, num_cards, num_cards, num_classes, 2)
+        grid = np.indices((self.num_states,) + dims).reshape(len(dims)+1, -1)
+        sim_states = np.column_stack((np.append(0., cards)[grid[1]], grid[2:5].T, np.zeros(grid.shape[1]), grid[6]))
+
+        shape = (len(m), self.num_states) + dims
+        actions = np.empty(shape, dtype=np.int8)
+        transitions = np.empty(shape, dtype=np.int16)
+        for i, member in enumerate(m):
+            # classes beyond the member's own are never looked up; they repeat its last class
+            sim_states[:, 4] = representatives[i][np.minimum(grid[5], len(representatives[i])-1)]
+            current_states = grid[0].copy()
+            actions[i] = self.run_many(sim_states, current_states, np.full(len(current_states), member)).reshape(shape[1:])
+            transitions[i] = current_states.reshape(shape[1:])
+        return fractions, fraction_class, actions, transitions
+
+    def two_point_crossover(self, first, second, rng=np.random):
+        """Two-point crossover between each pair (first[k], second[k]), in place."""
+        pairs = np.column_stack((self._members(first), self._members(second)))
+        self.reproduce(pairs, pairs, rng=rng)
+
+    def mutate(self, members, num_mutations=1, rng=np.random):
+        """Apply num_mutations successive BDA.mutate steps to every member, in one vectorized step.
+
+        When several mutations hit the same object of the same state, the last one wins, exactly
+        as if they were applied one after another.
+
+        """
+        m = np.repeat(self._members(members), num_mutations)
+        q = rng.randint(0, self.num_states, len(m)) # select state to mutate
+        obj = rng.randint(0, 7, len(m)) # pick an object to mutate
+        key = (m*self.num_states + q)*7 + obj
+        _, last = np.unique(key[::-1], return_index=True)
+        keep = len(key) - 1 - last # last mutation of every (member, state, object)
+        m, q, obj = m[keep], q[keep], obj[keep]
+        high = np.array([NUM_INPUTS, NUM_TESTS, 1001, self.num_states, self.num_states, NUM_ACTIONS, NUM_ACTIONS])[obj]
+        value = np.floor(rng.random_sample(len(obj))*high).astype(np.int64)
+        for which, field, col in ((0, self.decision_index, None),
+                                  (1, self.decision_type, None),
+                                  (3, self.transitions, 0),
+                                  (4, self.transitions, 1),
+                                  (5, self.actions, 0),
+                                  (6, self.actions, 1)):
+            hit = obj == which
+            if col is None:
+                field[m[hit], q[hit]] = value[hit]
+            else:
+                field[m[hit], q[hit], col] = value[hit]
+        hit = obj == 2
+        self.threshold[m[hit], q[hit]] = value[hit]/1000
+
+    def reproduce(self, children, parents, num_mutations=0, rng=np.random):
+        """Write two-point crossover children of parent pairs straight into the children's slots.
+
+        Child children[k][0] starts as parents[k][0] and child children[k][1] as parents[k][1];
+        states in a random [pt1, pt2) range are swapped between them and both are then mutated
+        num_mutations times. Parents are read into flat buffers first, so a child may replace
+        one of its own parents.
+
+        Args:
+            children (array): (k, 2) members to overwrite
+            parents (array): (k, 2) parent members
+
+        """
+        children = np.reshape(np.asarray(children, dtype=np.int64), (-1, 2))
+        parents = np.reshape(np.asarray(parents, dtype=np.int64), (-1, 2))
+        pts = np.sort(rng.randint(0, self.num_states, (len(parents), 2)), axis=1)
+        positions = np.arange(self.num_states)
+        swap = (positions >= pts[:, :1]) & (positions < pts[:, 1:]) # (pairs, num_states)
+        for field in (self.decision_index, self.decision_type, self.threshold, self.actions, self.transitions):
+            a = field[parents[:, 0]]
+            b = field[parents[:, 1]]
+            mask = swap.reshape(swap.shape + (1,)*(a.ndim - 2))
+            field[children[:, 0]] = np.where(mask, b, a)
+            field[children[:, 1]] = np.where(mask, a, b)
+        if num_mutations > 0:
+            self.mutate(children.ravel(), num_mutations, rng)
+
+    def to_records(self, members=None):
+        """Return members as a (len(members), num_states) array of packed GENOME_DTYPE records."""
+        m = self._members(members)
+        check_genes(self.decision_index[m], self.decision_type[m], self.actions[m], self.transitions[m],
+                    self.num_states)
+        records = np.zeros((len(m), self.num_states), dtype=GENOME_DTYPE)
+        records['decision_index'] = self.decision_index[m]
+        records['decision_type'] = self.decision_type[m]
+        records['actions'] = self.actions[m]
+        records['transitions'] = self.transitions[m]
+        records['threshold'] = self.threshold[m]
+        return records
+
+    def set_records(self, members, records):
+        """Overwrite members from a (len(members), num_states) array of GENOME_DTYPE records."""
+        m = self._members(members)
+        self.decision_index[m] = records['decision_index']
+        self.decision_type[m] = records['decision_type']
+        self.actions[m] = records['actions']
+        self.transitions[m] = records['transitions']
+        self.threshold[m] = records['threshold']
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a population from a (pop_size, num_states) array of GENOME_DTYPE records."""
+        population = cls(records.shape[0], records.shape[1])
+        population.set_records(None, records)
+        return population
+
+    @classmethod
+    def from_bdas(cls, bdas):
+        population = cls(len(bdas), bdas[0].num_states)
+        for i, b in enumerate(bdas):
+            for n, state in enumerate(b.states):
+                population.decision_index[i, n] = state.decision_index
+                population.decision_type[i, n] = state.decision_type
+                population.threshold[i, n] = state.threshold_val
+                population.actions[i, n] = state.actions
+                population.transitions[i, n] = state.transitions
+        return population
+
+    def to_bda(self, i):
+        b = BDA(self.num_states)
+        for n, state in enumerate(b.states):
+            state.decision_index = int(self.decision_index[i, n])
+            state.decision_type = int(self.decision_type[i, n])
+            state.threshold_val = float(self.threshold[i, n])
+            state.actions = [int(a) for a in self.actions[i, n]]
+            state.transitions = [int(t) for t in self.transitions[i, n]]
+        return b
+
+    def write_bda(self, i):
+        return self.to_bda(i).write_bda()
+
+    def read_bda(self, i, bda_array): # overwrite member i from read_bda rows
+        bda_array = np.asarray(bda_array, dtype=np.float64)
+        self.decision_index[i] = bda_array[:, 0]
+        self.decision_type[i] = bda_array[:, 1]
+        self.threshold[i] = bda_array[:, 2]
+        self.actions[i] = bda_array[:, [3, 5]]
+        self.transitions[i] = bda_array[:, [4, 6]]
+
+    def print_bda(self, i):
+        return self.to_bda(i).print_bda()
+
+
+def save_population(path, genomes):
+    """Write a BDAPopulation, or an array of GENOME_DTYPE records of any shape (e.g. the
+    (num_runs, pop_size, num_states) final populations of an experiment), to one .npy file."""
+    if isinstance(genomes, BDAPopulation):
+        genomes = genomes.to_records()
+    genomes = np.asarray(genomes, dtype=GENOME_DTYPE)
+    check_genes(genomes['decision_index'], genomes['decision_type'], genomes['actions'],
+                genomes['transitions'], genomes.shape[-1])
+    with open(path, 'wb') as genome_file:
+        np.save(genome_file, genomes)
+
+
+def load_genomes(path, mmap_mode='r'):
+    """Return the GENOME_DTYPE records saved at path, memory-mapped by default."""
+    genomes = np.load(path, mmap_mode=mmap_mode)
+    assert genomes.dtype == GENOME_DTYPE, '%s does not hold BDA genome records' % path
+    return genomes
+
+
+def load_population(path, index=()):
+    """Load the population saved at path (or population index of an archive of several)."""
+    return BDAPopulation.from_records(load_genomes(path)[index])
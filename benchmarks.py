@@ -0,0 +1,262 @@
+"""Benchmarks of the divide-the-dollar hot paths.
+
+Every benchmark is seeded, runs a fixed amount of work and reports the best of several
+repeats as JSON, so results can be stored and compared between commits.
+
+Usage:
+    python benchmarks.py [--repeat 3] [--only bda_run,play_game] [--output results.json]
+"""
+from __future__ import division
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+import batch_game
+import bda
+import divide_dollar_bda
+import divide_the_dollar
+import fastgame
+import game
+from mc import MonteCarloLearning
+
+SEED = 12345
+
+BENCHMARKS = []
+
+
+def benchmark(unit):
+    """Register a benchmark; the function sets up its work and returns (run, ops).
+
+    It may return (run, ops, prepare) instead: prepare() is called untimed before every repeat,
+    to rebuild the state that run consumes or changes.
+    """
+    def register(setup):
+        BENCHMARKS.append((setup.__name__, unit, setup))
+        return setup
+    return register
+
+
+def seed_all(seed=SEED):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def random_bdas(num_bdas):
+    bdas = [bda.BDA(divide_dollar_bda.bda_states) for _ in xrange(num_bdas)]
+    for b in bdas:
+        b.randomize()
+    return bdas
+
+
+def reset_q_learning():
+    """Restart divide_the_dollar's global Monte Carlo learning from scratch."""
+    q_learning = divide_the_dollar.q_learning
+    q_learning.__init__(q_learning.num_states, q_learning.num_actions)
+
+
+def random_sim_states(num_states):
+    """Return sim_states drawn from the inputs a BDA sees during a game."""
+    cards = divide_dollar_bda.cards
+    hands = np.sort(np.random.randint(0, len(cards), (num_states, 3)), axis=1)
+    rounds = np.random.randint(0, divide_dollar_bda.num_rounds, num_states)
+    first = np.random.randint(0, 2, num_states)
+    showing = np.where(first == 0, 0., np.array(cards)[np.random.randint(0, len(cards), num_states)])
+    deals = np.floor(np.random.random_sample(num_states) * (rounds + 1))
+    return np.column_stack((showing, hands, deals / (rounds + 1), first))
+
+
+@benchmark('decisions')
+def bda_run():
+    bdas = random_bdas(50)
+    sim_states = random_sim_states(20000).tolist()
+
+    def run():
+        for i, sim_state in enumerate(sim_states):
+            bdas[i % 50].run(sim_state)
+    return run, len(sim_states)
+
+
+@benchmark('decisions')
+def bda_run_many():
+    population = bda.BDAPopulation.from_bdas(random_bdas(50))
+    sim_states = random_sim_states(200000)
+    members = np.arange(len(sim_states)) % 50
+    current_states = np.zeros(len(sim_states), dtype=np.int64)
+
+    def run():
+        population.run_many(sim_states, current_states, members)
+    return run, len(sim_states)
+
+
+@benchmark('calls')
+def play_action():
+    hands = [sorted(np.random.randint(0, 3, 5).tolist()) for _ in xrange(20000)]
+    showing = np.random.randint(0, 4, len(hands)).tolist()
+    actions = np.random.randint(0, 3, len(hands)).tolist()
+    players = []
+
+    def prepare(): # play_action removes the played card from the hand
+        players[:] = [game.Hand(hand) for hand in hands]
+
+    def run():
+        for player, card_showing, action in zip(players, showing, actions):
+            divide_dollar_bda.play_action(card_showing, player, action)
+    return run, len(hands), prepare
+
+
+@benchmark('calls')
+def play_action_batch():
+    cards = divide_dollar_bda.cards
+    hands = batch_game.count_cards(np.random.randint(0, 3, (200000, 5)), len(cards))
+    showing = np.random.randint(0, 4, len(hands))
+    actions = np.random.randint(0, 3, len(hands))
+    players = []
+
+    def prepare(): # play_action_batch removes the played cards from the hands
+        players[:] = [hands.copy()]
+
+    def run():
+        batch_game.play_action_batch(showing, players[0], actions, cards,
+                                     divide_dollar_bda.hand_size)
+    return run, len(hands), prepare
+
+
+@benchmark('games')
+def play_game():
+    bdas = random_bdas(2)
+    decks = batch_game.shuffled_decks(200, divide_dollar_bda.num_of_unique_cards).tolist()
+
+    def run():
+        for deck in decks:
+            divide_dollar_bda.play_game(bdas[0], bdas[1], deck)
+    return run, len(decks)
+
+
+@benchmark('games')
+def play_game_fast():
+    bdas = [fastgame.FastBDA.from_bda(b) for b in random_bdas(2)]
+    decks = batch_game.shuffled_decks(200, divide_dollar_bda.num_of_unique_cards).tolist()
+    card_game = fastgame.FastGame(divide_dollar_bda.cards, divide_dollar_bda.hand_size)
+
+    def run():
+        for deck in decks:
+            card_game.play(bdas[0], bdas[1], deck)
+    return run, len(decks)
+
+
+@benchmark('games')
+def play_games_batch():
+    population = bda.BDAPopulation(40, divide_dollar_bda.bda_states)
+    population.randomize()
+    decks = batch_game.shuffled_decks(5000, divide_dollar_bda.num_of_unique_cards)
+    p1_members = np.random.randint(0, 15, len(decks))
+    p2_members = np.random.randint(15, 40, len(decks))
+
+    def run():
+        batch_game.play_games(decks, batch_game.PopulationPolicy(population, p1_members),
+                              batch_game.PopulationPolicy(population, p2_members),
+                              divide_dollar_bda.cards, divide_dollar_bda.hand_size)
+    return run, len(decks)
+
+
+@benchmark('games')
+def mc_train():
+    def run():
+        divide_the_dollar.train(500)
+    return run, 500, reset_q_learning
+
+
+@benchmark('games')
+def mc_train_batch():
+    def run():
+        divide_the_dollar.train_batch(50000, 10000)
+    return run, 50000, reset_q_learning
+
+
+@benchmark('updates')
+def mc_update():
+    q_learning = MonteCarloLearning(40, 3)
+    states = np.random.randint(0, 40, 50000).tolist()
+    actions = np.random.randint(0, 3, len(states)).tolist()
+    rewards = np.random.randint(-1, 2, len(states)).tolist()
+
+    def run():
+        for state_index, action_index, reward in zip(states, actions, rewards):
+            q_learning.update(state_index, action_index, reward)
+    return run, len(states)
+
+
+@benchmark('updates')
+def mc_update_batch():
+    q_learning = MonteCarloLearning(40, 3)
+    states = np.random.randint(0, 40, 1000000)
+    actions = np.random.randint(0, 3, len(states))
+    rewards = np.random.randint(-1, 2, len(states))
+
+    def run():
+        q_learning.update_batch(states, actions, rewards)
+    return run, len(states)
+
+
+@benchmark('generations')
+def round_robin_generation():
+    d = divide_dollar_bda
+    population = d.init_pop()
+
+    def run():
+        batch_game.round_robin(population, d.pop_size, d.rand_pop_size, d.num_episodes,
+                               d.num_of_unique_cards, d.cards, d.hand_size)
+    return run, 1
+
+
+def run_benchmark(name, unit, setup, repeat):
+    """Return the result record of one benchmark (best of repeat timings)."""
+    seed_all()
+    work = setup()
+    run, ops = work[:2]
+    prepare = work[2] if len(work) > 2 else None
+    timings = []
+    for _ in xrange(repeat):
+        seed_all()
+        if prepare is not None:
+            prepare()
+        start = time.time()
+        run()
+        timings.append(time.time() - start)
+    best = min(timings)
+    return {'name': name, 'unit': unit, 'ops': ops, 'seconds': best,
+            'ops_per_sec': ops / best if best > 0 else float('inf'), 'timings': timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=3, help='timings per benchmark')
+    parser.add_argument('--only', help='comma-separated benchmark names to run')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    selected = args.only.split(',') if args.only else [name for name, _, _ in BENCHMARKS]
+    results = []
+    for name, unit, setup in BENCHMARKS:
+        if name in selected:
+            results.append(run_benchmark(name, unit, setup, args.repeat))
+            sys.stderr.write('%-24s %14.1f %s/sec\n'
+                             % (name, results[-1]['ops_per_sec'], unit))
+
+    report = {'seed': SEED, 'repeat': args.repeat, 'python': platform.python_version(),
+              'numpy': np.__version__, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,22 @@
 from __future__ import division
 
-import copy
+import os
 import time
 
+import batch_game
 import bda
+import exact_eval
+import fastgame
+import fitness_cache
+import game
+import hall_of_fame
+import instrument
+import parallel_eval
+import stats_sink
 import numpy as np
-import scipy.stats as st
 
 """Evolving BDA agents to play divide-the-dollar."""
 
-start = time.clock()
-
 # Parameters for divide-the-dollar game ##
 cards = [0.25, 0.50, 0.75]  # specifies the unique cards in the deck: indexed as [0,1,2]
 num_of_unique_cards = [16, 28, 16]  # specifies the total number of each of the unique cards
@@ -27,6 +33,7 @@ bda_states = 8
 actions = {'small_spoil': 0, 'median': 1, 'large_max': 2}
 num_actions = len(actions)
 assert num_actions == bda.NUM_ACTIONS, "num_actions=%i does not match bda.NUM_ACTIONS=%i" % (num_actions, bda.NUM_ACTIONS)
+assert bda_states <= bda.MAX_RECORD_STATES, "bda_states=%i exceeds bda.MAX_RECORD_STATES=%i" % (bda_states, bda.MAX_RECORD_STATES)
 
 # Parameters for evolution
 pop_size = 15
@@ -35,13 +42,82 @@ t_size = 11
 max_mutations = 9
 num_gens = 250
 num_runs = 100
-
-
-def init_pop():
-    pop = []
-    for i in xrange(pop_size+rand_pop_size):
-        pop.append(bda.BDA(bda_states))
-        pop[i].randomize()
+num_workers = 1  # worker processes for fitness evaluation (1 = evaluate in this process)
+engine = 'numpy'  # plays the plain round-robin: 'numpy' (batched) or 'python' (fastgame, one game at a time; faster for a few hundred games or less)
+fitness_cache_size = 0  # genomes whose match statistics are cached across generations (0 = no cache)
+refresh_episodes = 1  # games a cached genome plays against each new random opponent
+adaptive_episodes = 0  # successive halving: undecided evolving agents play up to this many games per opponent, stopping once surely in or out of the members that can become parents (0 = always num_episodes)
+min_episodes = 2  # games an undecided agent plays against each opponent per adaptive step
+exact_max_states = 0  # exact expected-value fitness while every matchup's distribution of game states stays this small, else common decks (small decks only; 0 = off)
+common_decks = False  # replay one bank of num_episodes decks for every matchup, from both seats
+fixed_opponents = None  # play a fixed, precompiled opponent pool instead of new random opponents every generation: 'random' (drawn once per run) or a hall of fame / population .npy file
+hall_of_fame_size = 0  # fittest distinct genomes of all generations archived in hof-<run>.npy (0 = no archive)
+profile_hot_paths = False  # write a per-generation hot-path profile to profile-<run>.txt
+
+# Settings an evolve() config may override
+CONFIG_KEYS = ('cards', 'num_of_unique_cards', 'hand_size', 'num_episodes', 'bda_states', 'pop_size',
+               'rand_pop_size', 't_size', 'max_mutations', 'num_gens', 'fitness_cache_size',
+               'refresh_episodes', 'adaptive_episodes', 'min_episodes', 'exact_max_states',
+               'common_decks', 'fixed_opponents', 'hall_of_fame_size')
+
+
+def current_config():
+    """Return the current settings as an evolve() config."""
+    return dict((key, globals()[key]) for key in CONFIG_KEYS)
+
+
+def resolve_config(config=None):
+    """Return the current settings overridden by config, validated, with the derived game settings.
+
+    The module settings are left untouched: the returned dict is passed explicitly to the
+    functions of a run, so several configs can be evolved in turn or side by side.
+    """
+    config = config or {}
+    unknown = sorted(set(config) - set(CONFIG_KEYS))
+    if unknown:
+        raise ValueError('unknown config keys: %s' % ', '.join(unknown))
+    settings = dict(current_config(), **config)
+    if len(settings['cards']) != len(settings['num_of_unique_cards']):
+        raise ValueError('cards and num_of_unique_cards must have the same length')
+    if settings['hand_size'] % 2 != 1:
+        raise ValueError('hand_size must be odd')
+    if not 1 <= settings['bda_states'] <= bda.MAX_RECORD_STATES:
+        raise ValueError('bda_states must be between 1 and %i' % bda.MAX_RECORD_STATES)
+    if not 2 <= settings['t_size'] <= settings['pop_size']:
+        raise ValueError('t_size must be between 2 and pop_size')
+    if settings['adaptive_episodes'] > 0 and settings['min_episodes'] < 1:
+        raise ValueError('min_episodes must be at least 1 with adaptive_episodes')
+    check_evaluation_modes(settings)
+
+    settings['num_cards'] = len(settings['cards'])
+    settings['deck_size'] = sum(settings['num_of_unique_cards'])
+    settings['num_rounds'] = 1+(settings['deck_size']-(num_players*settings['hand_size']))//num_players
+    return settings
+
+
+def evaluation_modes(settings, evaluator=None):
+    """Return the names of the settings (and worker evaluator) that replace the plain round-robin."""
+    enabled = [('fixed_opponents', settings['fixed_opponents'] is not None),
+               ('fitness_cache_size', settings['fitness_cache_size'] > 0),
+               ('num_workers', evaluator is not None),
+               ('common_decks', bool(settings['common_decks'])),
+               ('adaptive_episodes', settings['adaptive_episodes'] > 0),
+               ('exact_max_states', settings['exact_max_states'] > 0),
+               ('engine', engine != 'numpy')]
+    return [name for name, on in enabled if on]
+
+
+def check_evaluation_modes(settings, evaluator=None):
+    """Raise ValueError if settings enable more than one evaluation mode (evaluate_pop applies only one)."""
+    modes = evaluation_modes(settings, evaluator)
+    if len(modes) > 1:
+        raise ValueError('conflicting evaluation modes: %s (enable at most one)' % ', '.join(modes))
+
+
+def init_pop(config=None):
+    c = config or resolve_config()
+    pop = bda.BDAPopulation(c['pop_size']+c['rand_pop_size'], c['bda_states'])
+    pop.randomize()
     return pop
 
 
@@ -53,42 +129,74 @@ def load_deck():
 
 
 def play_action(card_showing, player, player_action):
+    # player is a game.Hand of card indices; the played card is removed from it in place
     if card_showing == num_cards: # player's going first
         if player_action == actions['small_spoil']:
-            player_card_value = cards[player[0]] # play smallest card
-            card_showing = player[0] # update card showing
-            player = np.delete(player, 0) # remove card from player's hand
+            card = player.smallest() # play smallest card
         elif player_action == actions['large_max']:
-            player_card_value = cards[player[-1]] # play largest card
-            card_showing = player[-1] # update card showing
-            player = np.delete(player, -1) # remove card from player's hand
+            card = player.largest() # play largest card
         else:
-            player_card_value = cards[player[hand_size//2]] # play median card
-            card_showing = player[hand_size//2] # update card showing
-            player = np.delete(player, hand_size//2) # remove card from player's hand
+            card = player[hand_size//2] # play median card
+        card_showing = card # update card showing
     else: # opponent went first, player's turn
-        if player_action == actions['small_spoil']: # spoil with smallest card
-            for c, pcard in enumerate(player):
-                if cards[pcard] + cards[card_showing] > 1.0: # can spoil, play this card
-                    player_card_value = cards[player[c]]
-                    player = np.delete(player, c) # remove card from player's hand
-                    break
-                elif c == len(player)-1: # can't spoil, play largest card
-                    player_card_value = cards[player[-1]]
-                    player = np.delete(player, -1) # remove card from player's hand
-        elif player_action == actions['large_max']: # maximize score with largest card
-            for c, pcard in enumerate(np.flipud(player)):
-                if cards[pcard] + cards[card_showing] <= 1.0: # can maximize, play this card
-                    player_card_value = cards[player[len(player)-1-c]]
-                    player = np.delete(player, len(player)-1-c) # remove card from player's hand
-                    break
-                elif len(player)-c == 0: # can't maximize, play smallest card
-                    player_card_value = cards[player[0]]
-                    player = np.delete(player, 0) # remove card from player's hand
+        if player_action == actions['small_spoil']: # spoil with smallest card (largest card if it can't spoil)
+            card = player.spoil(cards[card_showing], cards)
+        elif player_action == actions['large_max']: # maximize score with largest card (smallest card if it can't maximize)
+            card = player.maximize(cards[card_showing], cards)
         else:
-            player_card_value = cards[player[hand_size//2]] # play median card
-            player = np.delete(player, hand_size//2) # remove card from player's hand
-    return card_showing, player, player_card_value
+            card = player[hand_size//2] # play median card
+    player.remove(card) # remove card from player's hand
+    return card_showing, player, cards[card]
+
+
+def play_game(p1, p2, deck):
+    # Serial reference game between BDA objects p1 and p2 on a shuffled deck of card indices
+    p1.reset()
+    p2.reset()
+    p1_total_score = 0
+    p2_total_score = 0
+    num_deals = 0  # number of times a round resulted in a positive score for both players
+
+    # Deal initial hands
+    p1_cards = game.Hand(deck[:hand_size])
+    p2_cards = game.Hand(deck[hand_size:2*hand_size])
+    next_card = 2*hand_size
+
+    for round_index in xrange(num_rounds):
+        # Determine the value of the card showing (0 if playing first; opponent's pick if playing second)
+        card_showing = num_cards # an index of 'num_cards' corresponds to no card showing (i.e. zero)
+        if round_index % 2 == 0:
+            # Player 1 goes first
+            p1_game_state = [0, p1_cards.smallest(), p1_cards[hand_size//2], p1_cards.largest(), num_deals/(round_index+1), 0]
+            card_showing, p1_cards, p1_card_value = play_action(card_showing, p1_cards, p1.run(p1_game_state))
+
+            # Player 2 goes second
+            p2_game_state = [cards[card_showing], p2_cards.smallest(), p2_cards[hand_size//2], p2_cards.largest(), num_deals/(round_index+1), 1]
+            card_showing, p2_cards, p2_card_value = play_action(card_showing, p2_cards, p2.run(p2_game_state))
+        else:
+            # Player 2 goes first
+            p2_game_state = [0, p2_cards.smallest(), p2_cards[hand_size//2], p2_cards.largest(), num_deals/(round_index+1), 0]
+            card_showing, p2_cards, p2_card_value = play_action(card_showing, p2_cards, p2.run(p2_game_state))
+
+            # Player 1 goes second
+            p1_game_state = [cards[card_showing], p1_cards.smallest(), p1_cards[hand_size//2], p1_cards.largest(), num_deals/(round_index+1), 1]
+            card_showing, p1_cards, p1_card_value = play_action(card_showing, p1_cards, p1.run(p1_game_state))
+
+        # Determine score for playing this hand
+        if p1_card_value + p2_card_value <= 1:
+            p1_total_score += p1_card_value
+            p2_total_score += p2_card_value
+            num_deals += 1
+
+        # If deck isn't empty, pick up new cards
+        if next_card < len(deck):
+            p1_cards.add(deck[next_card:next_card+1])
+            next_card += 1
+        if next_card < len(deck):
+            p2_cards.add(deck[next_card:next_card+1])
+            next_card += 1
+
+    return p1_total_score, p2_total_score
 
 
 def save_pop(run, pop, fit):
@@ -96,149 +204,186 @@ def save_pop(run, pop, fit):
     first = True
     for i in np.argsort(fit)[0:][::-1]:
         if first:
-            pop_file.write('%s\n\n' % bda_pop[i].write_bda())
+            pop_file.write('%s\n\n' % pop.write_bda(i))
             first = False
-        pop_file.write('%.6f -fitness\n%s\n\n' % (fit[i],bda_pop[i].print_bda()))
+        pop_file.write('%.6f -fitness\n%s\n\n' % (fit[i],pop.print_bda(i)))
     pop_file.close()
 
 
-def report_fit_stats(stats_file, run, fit):
-    mean = np.mean(fit)
-    ci = st.t.interval(0.95, len(fit)-1, loc=mean, scale=st.sem(fit))
-    std = np.std(fit)
-    best = np.amax(fit)
-    stats_file.write('%.6f %.6f %.6f %.6f\n' % (mean, ci[1], std, best))
-
-
-for run in xrange(0,num_runs):
-    print 'run %i' % run
-    win_percen_file = open('win_percen-%i.txt' % run, 'w')
-    plus_minus_file = open('plus_minus-%i.txt' % run, 'w')
-    score_earned_file = open('score_earned-%i.txt' % run, 'w')
-    score_diff_file = open('score_diff-%i.txt' % run, 'w')
-    bda_pop = init_pop()
-    dx = np.array([i for i in xrange(pop_size)])  # sorting index
+def load_opponents(config=None):
+    """Return the fixed opponent pool of a run (None if fixed_opponents is not set)."""
+    c = config or resolve_config()
+    if c['fixed_opponents'] is None:
+        return None
+    elif c['fixed_opponents'] == 'random':
+        return hall_of_fame.OpponentPool.random(c['rand_pop_size'], c['bda_states'], c['cards'],
+                                                c['num_rounds'])
+    return hall_of_fame.OpponentPool.load(c['fixed_opponents'], c['cards'], c['num_rounds'],
+                                          c['rand_pop_size'])
+
+
+def evaluate_pop(bda_pop, cache=None, evaluator=None, opponents=None, config=None):
+    """Play the round-robin of one generation; return wins, losses, plus_minus, score_earned, score_diff.
+
+    At most one evaluation mode may be enabled (see check_evaluation_modes); it replaces the plain
+    round-robin. config is a resolve_config() dict (default: the module settings).
+    """
+    c = config or resolve_config()
+    pop_size, rand_pop_size, num_episodes = c['pop_size'], c['rand_pop_size'], c['num_episodes']
+    game_settings = c['num_of_unique_cards'], c['cards'], c['hand_size']
+    if opponents is not None:
+        return hall_of_fame.pool_round_robin(
+            bda_pop, pop_size, opponents, rand_pop_size, num_episodes, *game_settings)
+    elif cache is not None:
+        return fitness_cache.cached_round_robin(
+            cache, bda_pop, pop_size, rand_pop_size, num_episodes, c['refresh_episodes'],
+            *game_settings)
+    elif evaluator is not None:
+        return evaluator.round_robin(
+            bda_pop, pop_size, rand_pop_size, num_episodes, *game_settings)
+    elif c['common_decks']:
+        return batch_game.crn_round_robin(
+            bda_pop, pop_size, rand_pop_size, num_episodes, *game_settings)
+    elif c['adaptive_episodes'] > 0:
+        # Only the pop_size-t_size+2 fittest members can win a place among a tournament's best two
+        return batch_game.adaptive_round_robin(
+            bda_pop, pop_size, rand_pop_size, num_episodes, c['min_episodes'],
+            c['adaptive_episodes'], pop_size - c['t_size'] + 2, *game_settings)[:5]
+    elif c['exact_max_states'] > 0:
+        return exact_eval.exact_round_robin(
+            bda_pop, pop_size, rand_pop_size, num_episodes, *game_settings,
+            max_states=c['exact_max_states'])
+    elif engine == 'python':
+        return fastgame.round_robin(
+            bda_pop, pop_size, rand_pop_size, num_episodes, *game_settings)
+    return batch_game.round_robin(
+        bda_pop, pop_size, rand_pop_size, num_episodes, *game_settings)
+
+
+def select_and_reproduce(bda_pop, fit, config=None):
+    """Tournament selection: the worst two participants are replaced by children of the best two.
+
+    Returns:
+        (array): members that were replaced
+
+    """
+    c = config or resolve_config()
+    t_size = c['t_size']
+
+    # Choose and sort the mating tournament participants
+    dx = np.random.permutation(len(fit)) # sorting index
+    dx[:t_size] = dx[:t_size][fit[dx][:t_size].argsort()]
+
+    # Crossover (replace worst two with crossover result of best two) and mutation
+    bda_pop.reproduce(dx[:2], [dx[t_size-1], dx[t_size-2]], c['max_mutations'])
+    return dx[:2]
+
+
+def run_evolution(run, sink, evaluator=None, output_dir='.', config=None, migrate=None):
+    """Evolve one population for num_gens generations.
+
+    Per-generation fitness statistics go to sink (a stats_sink.StatsSink); the final
+    population is written to output_dir/pop-<run>.txt. With profile_hot_paths, one profile line
+    per generation is appended to output_dir/profile-<run>.txt, and with hall_of_fame_size the
+    archive of the run's fittest genomes to output_dir/hof-<run>.npy. config is a
+    resolve_config() dict (default: the module settings). migrate(gen, bda_pop, fit, children),
+    if given, is called after the reproduction of every generation but the last (see
+    islands.py).
+
+    Returns:
+        (tuple): final population, and the fit, plus_minus, score_earned and score_diff of its
+            evolving members
+
+    """
+    def output_file(name):
+        return open(os.path.join(output_dir, name % run), 'w')
+
+    c = config or resolve_config()
+    pop_size, rand_pop_size, num_episodes, num_gens = (c['pop_size'], c['rand_pop_size'],
+                                                        c['num_episodes'], c['num_gens'])
+    check_evaluation_modes(c, evaluator)
+    opponents = load_opponents(c) # compiled before profiling starts
+    profile = instrument.enable() if profile_hot_paths else None
+
+    bda_pop = init_pop(c)
+    cache = fitness_cache.FitnessCache(c['fitness_cache_size']) if c['fitness_cache_size'] > 0 else None
+    hof = hall_of_fame.HallOfFame(c['bda_states'], c['hall_of_fame_size']) if c['hall_of_fame_size'] > 0 else None
     for gen in xrange(num_gens):
         #print 'gen %i' % gen
 
-        if gen != 0:
-            for i in xrange(pop_size,pop_size+rand_pop_size):
-                bda_pop[i].randomize()
-
-        # (fitness) score-keeping
-        wins = np.array([0 for i in xrange(pop_size+rand_pop_size)])
-        losses = np.array([0 for i in xrange(pop_size+rand_pop_size)])
-        plus_minus = np.array([0 for i in xrange(pop_size+rand_pop_size)])
-        score_earned = np.array([0 for i in xrange(pop_size+rand_pop_size)])
-        score_diff = np.array([0 for i in xrange(pop_size+rand_pop_size)])
-
-        ## Round-robin Match-ups ##
-        for p1_index in xrange(pop_size): # Player 1 - evolving
-            for p2_index in xrange(pop_size,pop_size+rand_pop_size):  # Player 2 - random
-                for ep in xrange(num_episodes):
-                    # Load and shuffle deck
-                    deck = load_deck()
-                    np.random.shuffle(deck)
-
-                    bda_pop[p1_index].reset()
-                    bda_pop[p2_index].reset()
-                    p1_total_score = 0
-                    p2_total_score = 0
-                    num_deals = 0  # number of times a round resulted in a positive score for both players
-
-                    # Deal initial hands
-                    p1_cards = np.sort(deck[:hand_size])
-                    deck = deck[hand_size:]
-                    p2_cards = np.sort(deck[:hand_size])
-                    deck = deck[hand_size:]
-
-                    for round_index in xrange(num_rounds):
-                        p1_card_value = 0
-                        p2_card_value = 0
-
-                        # Determine the value of the card showing (0 if playing first; opponent's pick if playing second)
-                        card_showing = num_cards # an index of 'num_cards' corresponds to no card showing (i.e. zero)
-                        if round_index % 2 == 0:
-                            # Player 1 goes first
-                            p1_game_state = [0, p1_cards[0], p1_cards[hand_size//2], p1_cards[-1], num_deals/(round_index+1), 0]
-                            p1_action = bda_pop[p1_index].run(p1_game_state)
-                            card_showing, p1_cards, p1_card_value = play_action(card_showing, p1_cards, p1_action)
-
-                            # Player 2 goes second
-                            p2_game_state = [cards[card_showing], p2_cards[0], p2_cards[hand_size//2], p2_cards[-1], num_deals/(round_index+1), 1]
-                            p2_action = bda_pop[p2_index].run(p2_game_state)
-                            card_showing, p2_cards, p2_card_value = play_action(card_showing, p2_cards, p2_action)
-                        else:
-                            # Player 2 goes first
-                            p2_game_state = [0, p2_cards[0], p2_cards[hand_size//2], p2_cards[-1], num_deals/(round_index+1), 0]
-                            p2_action = bda_pop[p2_index].run(p2_game_state)
-                            card_showing, p2_cards, p2_card_value = play_action(card_showing, p2_cards, p2_action)
-
-                            # Player 1 goes second
-                            p1_game_state = [cards[card_showing], p1_cards[0], p1_cards[hand_size//2], p1_cards[-1], num_deals/(round_index+1), 1]
-                            p1_action = bda_pop[p1_index].run(p1_game_state)
-                            card_showing, p1_cards, p1_card_value = play_action(card_showing, p1_cards, p1_action)
-
-                        # Determine score for playing this hand
-                        if p1_card_value + p2_card_value <= 1:
-                            p1_total_score += p1_card_value
-                            p2_total_score += p2_card_value
-                            num_deals += 1
-
-                        # If deck isn't empty, pick up new cards
-                        if len(deck) != 0:
-                            p1_cards = np.sort(np.append(p1_cards, deck[:1]))
-                            deck = deck[1:]
-                        if len(deck) != 0:
-                            p2_cards = np.sort(np.append(p2_cards, deck[:1]))
-                            deck = deck[1:]
-
-                    # Determine final winner of the game and give out reward (+score keeping)
-                    if p1_total_score > p2_total_score:
-                        wins[p1_index] += 1
-                        losses[p2_index] += 1
-                        plus_minus[p1_index] += 1
-                        plus_minus[p2_index] -= 1
-                    elif p1_total_score < p2_total_score:
-                        losses[p1_index] += 1
-                        wins[p2_index] += 1
-                        plus_minus[p2_index] += 1
-                        plus_minus[p1_index] -= 1
-                    score_earned[p1_index] += p1_total_score
-                    score_earned[p2_index] += p2_total_score
-                    score_diff[p1_index] += p1_total_score - p2_total_score
-                    score_diff[p2_index] += p2_total_score - p1_total_score
+        if gen != 0 and opponents is None:
+            bda_pop.randomize(np.arange(pop_size,pop_size+rand_pop_size))
+
+        # (fitness) score-keeping: all round-robin match-ups are played as one batch
+        with instrument.timer('evaluation'):
+            wins, losses, plus_minus, score_earned, score_diff = evaluate_pop(bda_pop, cache, evaluator, opponents, c)
 
         fit = wins[0:pop_size]/(rand_pop_size*num_episodes) # choose fitness measure (i.e. wins, plus_minus, score_earned, score_diff)
-        report_fit_stats(win_percen_file, run, wins[0:pop_size]/(rand_pop_size*num_episodes)) # save information about fitness for this generation
-        report_fit_stats(plus_minus_file, run, plus_minus[0:pop_size])
-        report_fit_stats(score_earned_file, run, score_earned[0:pop_size])
-        report_fit_stats(score_diff_file, run, score_diff[0:pop_size])
+        with instrument.timer('sink'):
+            sink.record(run, gen, 'win_percen', wins[0:pop_size]/(rand_pop_size*num_episodes)) # save information about fitness for this generation
+            sink.record(run, gen, 'plus_minus', plus_minus[0:pop_size])
+            sink.record(run, gen, 'score_earned', score_earned[0:pop_size])
+            sink.record(run, gen, 'score_diff', score_diff[0:pop_size])
+            if hof is not None:
+                hof.add(bda_pop, np.arange(pop_size), fit, run, gen)
         if gen == num_gens-1:
             #save_pop(run, bda_pop, fit)
-            pop_file = open('pop-%i.txt' % run, 'w')
+            pop_file = output_file('pop-%i.txt')
             for i in np.argsort(fit)[0:][::-1]:
-                pop_file.write('%.6f -fitness (%i %.2f %.2f)\n%s\n\n' % (fit[i], plus_minus[i], score_earned[i], score_diff[i], bda_pop[i].print_bda()))
+                pop_file.write('%.6f -fitness (%i %.2f %.2f)\n%s\n\n' % (fit[i], plus_minus[i], score_earned[i], score_diff[i], bda_pop.print_bda(i)))
             pop_file.close()
+            bda.save_population(os.path.join(output_dir, 'pop-%i.npy' % run),
+                                bda_pop.to_records(np.argsort(fit)[::-1])) # lossless genomes, best first
         else: ## Evolution time ##
-            # Choose and sort the mating tournament participants
-            dx = np.random.permutation(len(fit)) # sorting index
-            dx[:t_size] = dx[:t_size][fit[dx][:t_size].argsort()]
-
-            # Crossover (replace worst two with crossover result of best two)
-            bda_pop[dx[0]] = copy.deepcopy(bda_pop[dx[t_size-1]])
-            bda_pop[dx[1]] = copy.deepcopy(bda_pop[dx[t_size-2]])
-            bda_pop[dx[0]].two_point_crossover(bda_pop[dx[1]])
-            # Mutation
-            for m in xrange(max_mutations):
-                bda_pop[dx[0]].mutate()
-                bda_pop[dx[1]].mutate()
-
-    win_percen_file.close()
-    plus_minus_file.close()
-    score_earned_file.close()
-    score_diff_file.close()
-
-
-end = time.clock()
-print "%.2f minutes" % ((end-start)/60)
+            with instrument.timer('reproduction'):
+                children = select_and_reproduce(bda_pop, fit, c)
+            if migrate is not None:
+                migrate(gen, bda_pop, fit, children)
+
+        if profile is not None:
+            profile.dump(os.path.join(output_dir, 'profile-%i.txt' % run), gen)
+            profile.reset()
+
+    if hof is not None:
+        hof.save(os.path.join(output_dir, 'hof-%i.npy' % run))
+    if profile is not None:
+        instrument.disable()
+    if cache is not None:
+        print('run %i fitness cache: %i hits, %i misses (%.1f%% hit rate)'
+              % (run, cache.hits, cache.misses, 100*cache.hit_rate()))
+    return bda_pop, fit, plus_minus[0:pop_size], score_earned[0:pop_size], score_diff[0:pop_size]
+
+
+def evolve(config=None, run=0, output_dir='.', evaluator=None):
+    """Evolve one run under config (a dict of CONFIG_KEYS overrides) and return its statistics records.
+
+    The config is passed down explicitly and the module settings are never changed, so evolve is
+    re-entrant.
+    """
+    sink = stats_sink.StatsSink()
+    run_evolution(run, sink, evaluator, output_dir, resolve_config(config))
+    return sink.records()
+
+
+def main():
+    start = time.clock()
+
+    evaluator = None
+    if num_workers > 1:
+        evaluator = parallel_eval.ParallelEvaluator(num_workers)
+
+    sink = stats_sink.StatsSink('stats.bin')
+    for run in xrange(0,num_runs):
+        print('run %i' % run)
+        run_evolution(run, sink, evaluator)
+    sink.close()
+
+    if evaluator is not None:
+        evaluator.close()
+
+    end = time.clock()
+    print("%.2f minutes" % ((end-start)/60))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 """Monte Carlo agent learns to play divide-the-dollar."""
 from __future__ import division
 
+import argparse
+import time
+
 import numpy as np
-#import xrange
 
+import batch_game
 from game import CardGame, Deck, Player
 from mc import MonteCarloLearning
 
@@ -13,6 +16,7 @@ HAND_SIZE = 5
 ACTIONS = ['small_spoil', 'median', 'large_max']
 
 NUM_GAMES_TO_PLAY = 2000000
+UPDATE_EVERY = 100  # number of episodes whose returns are flushed into Q in one batch
 
 deck = Deck(CARDS_IN_DECK)
 card_game = CardGame(deck, NUM_PLAYERS, ACTIONS, HAND_SIZE)
@@ -28,19 +32,11 @@ def play_action(card_showing, player):
             card_value = player.play_card(card_game.hand_size // 2)
     else:  # opponent went first, player's turn
         if player.next_action == ACTIONS.index('small_spoil'):
-            for c, card in enumerate(player.hand):
-                if card + card_showing > 1.0:  # can spoil, play this card
-                    card_value = player.play_card(c)
-                    break
-                elif c == len(player.hand) - 1:  # can't spoil, play largest card
-                    card_value = player.play_card(-1)
+            # spoil with smallest card (largest card if it can't spoil)
+            card_value = player.play_value(player.hand.spoil(card_showing))
         elif player.next_action == ACTIONS.index('large_max'):
-            for c, card in enumerate(np.flipud(player.hand)):
-                if card + card_showing <= 1.0:  # can maximize, play this card
-                    card_value = player.play_card(len(player.hand) - 1 - c)
-                    break
-                elif len(player) - c == 0:  # can't maximize, play smallest card
-                    card_value = player.play_card(0)
+            # maximize score with largest card (smallest card if it can't maximize)
+            card_value = player.play_value(player.hand.maximize(card_showing))
         else:
             card_value = player.play_card(card_game.hand_size // 2)
     return card_value
@@ -48,65 +44,143 @@ def play_action(card_showing, player):
 
 def take_turn(player, round_index, card_showing, monte_carlo=False):
     player.set_game_state(card_showing)
+    game_state = card_game.encode_game_state(player.game_state)
     if monte_carlo:
-        q_learning.record_state_seen(player.game_state)
+        q_learning.record_state_seen(game_state)
 
-    policy_index = int(card_game.true_state_index[int(np.ravel_multi_index(
-        player.game_state, dims=(deck.num_unique_cards + 1, deck.num_unique_cards,
-                                 deck.num_unique_cards, deck.num_unique_cards)))])
+    policy_index = card_game.state_index(game_state)
 
     if monte_carlo and (round_index <= 1):  # exploring starts
         player.next_action = np.random.choice(card_game.num_actions)
     else:
         player.next_action = player.policy[policy_index]
+    if monte_carlo:
+        q_learning.record_action_taken(player.next_action)
 
     return play_action(card_showing, player)
 
 
 q_learning = MonteCarloLearning(card_game.num_states, card_game.num_actions)
-monte = Player()
-opponent = Player()
-
-for episode_index in xrange(NUM_GAMES_TO_PLAY):
-    deck.shuffle_deck()
-
-    monte.pick_up_cards(deck.deal_cards(card_game.hand_size))
-    opponent.pick_up_cards(deck.deal_cards(card_game.hand_size))
-
-    q_learning.clear_states_seen()
 
-    for round_index in xrange(card_game.num_rounds):
-        sum_of_cards = 0.
 
-        if round_index % 2 == 0:
-            sum_of_cards = take_turn(monte, round_index, sum_of_cards, monte_carlo=True)
-            sum_of_cards += take_turn(opponent, round_index, sum_of_cards)
+def train(num_games):
+    """Train by playing num_games self-play games one at a time through Player objects."""
+    monte = Player(q_learning.optimal_policy)
+    opponent = Player(q_learning.optimal_policy)
+    returns_states, returns_actions, returns_rewards = [], [], []
+
+    for episode_index in xrange(num_games):
+        deck.shuffle_deck()
+        for player in (monte, opponent):
+            player.reset_hand()
+            player.reset_score()
+
+        monte.pick_up_cards(deck.deal_cards(card_game.hand_size))
+        opponent.pick_up_cards(deck.deal_cards(card_game.hand_size))
+
+        q_learning.clear_states_seen()
+
+        for round_index in xrange(card_game.num_rounds):
+            sum_of_cards = 0.
+
+            if round_index % 2 == 0:
+                sum_of_cards = take_turn(monte, round_index, sum_of_cards, monte_carlo=True)
+                sum_of_cards += take_turn(opponent, round_index, sum_of_cards)
+            else:
+                sum_of_cards = take_turn(opponent, round_index, sum_of_cards)
+                sum_of_cards += take_turn(monte, round_index, sum_of_cards, monte_carlo=True)
+
+            if monte.last_card_played + opponent.last_card_played <= 1:
+                monte.total_score += monte.last_card_played
+                opponent.total_score += opponent.last_card_played
+
+            if deck.num_cards_left != 0:
+                monte.pick_up_cards(deck.deal_cards(1))
+            if deck.num_cards_left != 0:
+                opponent.pick_up_cards(deck.deal_cards(1))
+
+        reward = 0
+        if monte.total_score > opponent.total_score:
+            reward = +1
+            monte.wins += 1
+        elif monte.total_score < opponent.total_score:
+            reward = -1
+            opponent.wins += 1
+
+        returns_states += q_learning.states_seen
+        returns_actions += q_learning.actions_taken
+        returns_rewards += [reward] * len(q_learning.states_seen)
+        if (episode_index + 1) % UPDATE_EVERY == 0 or episode_index == num_games - 1:
+            q_learning.update_batch(card_game.state_indices(returns_states), returns_actions,
+                                    returns_rewards)
+            returns_states, returns_actions, returns_rewards = [], [], []
+
+    return monte.wins, opponent.wins
+
+
+def train_batch(num_games, batch_size):
+    """Train by simulating batch_size self-play games at a time as arrays.
+
+    Every batch is played with the current optimal_policy, then all of its returns are
+    applied with a single update_batch call.
+
+    """
+    wins = [0, 0]
+    for first_game in xrange(0, num_games, batch_size):
+        num_batch_games = min(batch_size, num_games - first_game)
+        monte = batch_game.MonteCarloPolicy(q_learning.optimal_policy, card_game, num_batch_games,
+                                            exploring_rounds=2, record=True)
+        opponent = batch_game.MonteCarloPolicy(q_learning.optimal_policy, card_game,
+                                               num_batch_games)
+        decks = batch_game.shuffled_decks(num_batch_games,
+                                          [deck.cards[card] for card in deck.card_values])
+        monte_scores, opponent_scores = batch_game.play_games(
+            decks, monte, opponent, card_game.card_values, card_game.hand_size)
+
+        rewards = np.sign(monte_scores - opponent_scores)
+        wins[0] += np.count_nonzero(rewards > 0)
+        wins[1] += np.count_nonzero(rewards < 0)
+        q_learning.update_batch(monte.states_seen.ravel(), monte.actions_taken.ravel(),
+                                np.repeat(rewards, card_game.num_rounds))
+    return wins[0], wins[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--games', type=int, default=NUM_GAMES_TO_PLAY,
+                        help='total number of training games, including those of a resumed checkpoint')
+    parser.add_argument('--batch-size', type=int, default=0,
+                        help='games simulated in parallel as arrays (0: one game at a time)')
+    parser.add_argument('--checkpoint-every', type=int, default=0,
+                        help='save a checkpoint every N games (0: only at the end)')
+    parser.add_argument('--resume', help='checkpoint to resume training from')
+    args = parser.parse_args()
+
+    episode = 0
+    if args.resume:
+        episode, _ = q_learning.load_learning(args.resume)
+        print('resuming from episode %i: %i of %i games left'
+              % (episode, max(args.games - episode, 0), args.games))
+
+    first_episode = episode
+    chunk_size = args.checkpoint_every if args.checkpoint_every > 0 else args.games
+    monte_wins, opponent_wins = 0, 0
+    start = time.time()
+    while episode < args.games:
+        num_games = min(chunk_size, args.games - episode)
+        if args.batch_size > 0:
+            wins = train_batch(num_games, args.batch_size)
         else:
-            card_showing = take_turn(opponent, round_index, sum_of_cards)
-            sum_of_cards = take_turn(monte, round_index, sum_of_cards, monte_carlo=True)
-
-        if monte.last_card_played + opponent.last_card_played <= 1:
-            monte.total_score += monte.last_card_played
-            opponent.total_score += opponent.last_card_played
-
-        monte.pick_up_cards(deck.deal_cards(1))
-        opponent.pick_up_cards(deck.deal_cards(1))
-
-    reward = 0
-    if monte.total_score > opponent.total_score:
-        reward = +1
-        monte.wins += 1
-    elif monte.total_score < opponent.total_score:
-        reward = -1
-        opponent.wins += 1
-
-    for state in xrange(len(q_learning.states_seen)):
-        state_index = int(card_game.true_state_index[int(np.ravel_multi_index(
-            q_learning.states_seen[state], dims=(deck.num_unique_cards + 1,
-                                                 deck.num_unique_cards,
-                                                 deck.num_unique_cards,
-                                                 deck.num_unique_cards)))])
-        action_index = int(card_game.true_state_index[int(q_learning.policy[state_index])])
-        q_learning.update(state_index, action_index, reward)
-
-q_learning.save_learning(NUM_GAMES_TO_PLAY)
+            wins = train(num_games)
+        monte_wins += wins[0]
+        opponent_wins += wins[1]
+        episode += num_games
+        q_learning.save_learning(episode, batch_size=args.batch_size)
+    elapsed = time.time() - start
+    games_played = episode - first_episode
+    print('%i games in %.1f s (%.0f games/sec): %i wins, %i losses'
+          % (games_played, elapsed, games_played / max(elapsed, 1e-9), monte_wins, opponent_wins))
+
+
+if __name__ == '__main__':
+    main()
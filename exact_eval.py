@@ -0,0 +1,199 @@
+"""Expected-value evaluation of divide-the-dollar matchups.
+
+exact_match computes the expected scores and win probabilities of a matchup exactly by
+propagating the probability distribution over game states round by round. A game state holds
+both hands and the deck as per-value card counts, the number of deals, both agents' internal
+states and the score difference. Equal states reached through different deals are merged, so
+the distribution stays far smaller than the number of possible shuffles. The number of deals is
+only tracked if an agent reads it, and the score difference only if win probabilities are needed.
+
+The distribution stays small enough only for small decks: on the standard 60-card deck a single
+matchup takes about a minute even without the score difference. When a matchup's distribution
+outgrows max_states, StateBudgetExceeded is raised, and exact_round_robin falls back to
+batch_game.crn_round_robin for the whole generation.
+"""
+from __future__ import division
+
+import itertools
+
+import numpy as np
+from scipy.special import comb
+
+import agents
+import batch_game
+import instrument
+
+SCORE_UNITS = 1000  # the score difference is tracked in thousandths of a dollar
+
+
+class StateBudgetExceeded(Exception):
+    """The exact distribution of a matchup needs more than max_states game states."""
+
+
+def initial_deals(num_of_unique_cards, hand_size):
+    """Return every possible deal of both starting hands and its probability.
+
+    Returns:
+        (tuple): (n, num_cards) card counts of player 1's hand, player 2's hand and the rest of
+            the deck, and the (n,) probability of each deal
+
+    """
+    counts = np.asarray(num_of_unique_cards, dtype=np.int64)
+    hands = np.array([hand for hand in itertools.product(xrange(hand_size + 1), repeat=len(counts))
+                      if sum(hand) == hand_size], dtype=np.int64)
+    p1_hands = np.repeat(hands, len(hands), axis=0)
+    p2_hands = np.tile(hands, (len(hands), 1))
+    rest = counts - p1_hands
+    prob = (np.prod(comb(counts, p1_hands), axis=1) / comb(counts.sum(), hand_size)
+            * np.prod(comb(np.maximum(rest, 0), p2_hands), axis=1)
+            / comb(counts.sum() - hand_size, hand_size))
+    dealt = (prob > 0) & np.all(rest >= 0, axis=1)
+    return p1_hands[dealt], p2_hands[dealt], (rest - p2_hands)[dealt], prob[dealt]
+
+
+def _draw(game_states, prob, hand, deck):
+    """Expand every game state by each card the player may pick up from the deck."""
+    num_cards = deck.stop - deck.start
+    remaining = game_states[0, deck].sum()
+    game_states = np.repeat(game_states, num_cards, axis=0)
+    card = np.tile(np.arange(num_cards), len(prob))
+    rows = np.arange(len(card))
+    prob = np.repeat(prob, num_cards) * game_states[rows, deck.start + card] / remaining
+    game_states[rows, deck.start + card] -= 1
+    game_states[rows, hand.start + card] += 1
+    drawn = prob > 0
+    return game_states[drawn], prob[drawn]
+
+
+def _merge(game_states, prob):
+    """Merge equal game states reached through different deals, adding up their probabilities."""
+    low = game_states.min(axis=0)
+    sizes = game_states.max(axis=0) - low + 1
+    if np.prod(sizes.astype(float)) < 2**62:
+        # Pack every game state into one integer key; much faster to sort than whole rows
+        strides = np.append(np.cumprod(sizes[::-1])[::-1][1:], 1)
+        _, first, merged = np.unique(np.dot(game_states - low, strides), return_index=True,
+                                     return_inverse=True)
+        game_states = game_states[first]
+    else:
+        game_states, merged = np.unique(game_states, axis=0, return_inverse=True)
+    return game_states, np.bincount(merged.ravel(), prob, len(game_states))
+
+
+def exact_match(p1, p2, num_of_unique_cards, cards, hand_size, max_states=100000,
+                win_probability=True):
+    """Return the exact expected outcome of one game between two agents (player 1 leads first).
+
+    Args:
+        p1, p2: agents (see agents.py)
+        num_of_unique_cards (list): number of cards of each value in the deck
+        cards (list): value of each unique card
+        hand_size (int): number of cards in a player's hand
+        max_states (int): largest distribution over game states to propagate
+        win_probability (bool): track the score difference to compute win probabilities
+
+    Returns:
+        (tuple): expected score of player 1 and player 2, probability that player 1 and
+            player 2 wins (nan if win_probability is False)
+
+    Raises:
+        StateBudgetExceeded: if the distribution grows past max_states game states
+
+    """
+    num_cards = len(cards)
+    deck_size = sum(num_of_unique_cards)
+    num_rounds = 1 + (deck_size - 2 * hand_size) // 2
+    shown_values = np.append(np.asarray(cards, dtype=float), 0.)
+    players = (p1, p2)
+    track_deals = p1.uses_fraction or p2.uses_fraction
+
+    # columns: player 1's hand, player 2's hand, deck, num_deals, agent states, score difference
+    hands = (slice(0, num_cards), slice(num_cards, 2 * num_cards))
+    deck = slice(2 * num_cards, 3 * num_cards)
+    num_deals = 3 * num_cards
+    agent_state = (num_deals + 1, num_deals + 2)
+    score_diff = num_deals + 3
+    p1_hands, p2_hands, rest, prob = initial_deals(num_of_unique_cards, hand_size)
+    game_states = np.zeros((len(prob), score_diff + 1), dtype=np.int64)
+    game_states[:, hands[0]] = p1_hands
+    game_states[:, hands[1]] = p2_hands
+    game_states[:, deck] = rest
+
+    expected = np.zeros(2)
+    for round_index in xrange(num_rounds):
+        card_showing = np.full(len(prob), num_cards, dtype=np.int64)
+        card_values = [None, None]
+        sim_states = np.empty((len(prob), 6))
+        for turn, player in enumerate((0, 1) if round_index % 2 == 0 else (1, 0)):
+            hand = game_states[:, hands[player]]
+            smallest, median, largest = batch_game.hand_summary(hand, hand_size)
+            sim_states[:, 0] = shown_values[card_showing]
+            sim_states[:, 1] = smallest
+            sim_states[:, 2] = median
+            sim_states[:, 3] = largest
+            sim_states[:, 4] = game_states[:, num_deals] / (round_index + 1)
+            sim_states[:, 5] = turn
+            player_actions, game_states[:, agent_state[player]] = players[player].decide(
+                game_states[:, agent_state[player]], sim_states)
+            card_showing, played = batch_game.play_action_batch(card_showing, hand,
+                                                                player_actions, cards, hand_size)
+            game_states[:, hands[player]] = hand
+            card_values[player] = shown_values[played]
+
+        # Both players score only if the cards played don't exceed the dollar
+        deal = card_values[0] + card_values[1] <= 1
+        expected[0] += np.dot(prob, card_values[0] * deal)
+        expected[1] += np.dot(prob, card_values[1] * deal)
+        if track_deals:
+            game_states[:, num_deals] += deal
+        if win_probability:
+            game_states[:, score_diff] += np.where(
+                deal, np.round((card_values[0] - card_values[1]) * SCORE_UNITS), 0).astype(np.int64)
+
+        for player in (0, 1):
+            if game_states[0, deck].sum() > 0:
+                game_states, prob = _draw(game_states, prob, hands[player], deck)
+
+        game_states, prob = _merge(game_states, prob)
+        if len(prob) > max_states:
+            raise StateBudgetExceeded('%i game states after round %i (max_states=%i)'
+                                      % (len(prob), round_index, max_states))
+
+    if not win_probability:
+        return expected[0], expected[1], np.nan, np.nan
+    return (expected[0], expected[1], prob[game_states[:, score_diff] > 0].sum(),
+            prob[game_states[:, score_diff] < 0].sum())
+
+
+def exact_round_robin(population, pop_size, rand_pop_size, num_episodes, num_of_unique_cards,
+                      cards, hand_size, max_states=20000, rng=np.random):
+    """Round-robin of exact expected outcomes instead of num_episodes random games per matchup.
+
+    Every (evolving, random) matchup is evaluated exactly, with outcomes scaled to num_episodes
+    games so the statistics are comparable with batch_game.round_robin. As soon as one matchup's
+    distribution outgrows max_states game states, the generation is evaluated by
+    batch_game.crn_round_robin instead.
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays over all agents
+
+    """
+    p1_matchup, p2_matchup = batch_game.matchup_members(
+        np.arange(pop_size), np.arange(pop_size, pop_size + rand_pop_size), 1)
+    outcomes = np.empty((len(p1_matchup), 4))
+    players = agents.population_agents(population)
+    try:
+        for k, (i, j) in enumerate(zip(p1_matchup, p2_matchup)):
+            outcomes[k] = exact_match(players[i], players[j], num_of_unique_cards, cards,
+                                      hand_size, max_states)
+    except StateBudgetExceeded:
+        if instrument.profile is not None:
+            instrument.profile.count('exact_fallbacks')
+        return batch_game.crn_round_robin(population, pop_size, rand_pop_size, num_episodes,
+                                          num_of_unique_cards, cards, hand_size, rng=rng)
+    if instrument.profile is not None:
+        instrument.profile.count('exact_matchups', len(p1_matchup))
+
+    p1_score, p2_score, p1_wins, p2_wins = (outcomes * num_episodes).T
+    return batch_game.expected_stats(p1_matchup, p2_matchup, p1_wins, p2_wins, p1_score, p2_score,
+                                     population.pop_size)
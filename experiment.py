@@ -0,0 +1,134 @@
+"""Run the independent evolutionary runs of divide_dollar_bda.py concurrently.
+
+Fitness statistics of all runs are appended to one stats.bin file (see stats_sink). Every
+finished run leaves a run-<i>.done checkpoint once its statistics are flushed; restarting the
+same experiment skips those runs, so an interrupted sweep resumes where it stopped. Once all
+runs are done, their final populations (pop-<i>.npy) are packed into one populations.npy
+archive; bda.load_population(path, run) memory-maps a single run's population from it. With
+divide_dollar_bda.hall_of_fame_size, the runs' archives are merged into hall_of_fame.npy.
+
+Usage:
+    python experiment.py --runs 100 --processes 8 --seed 1 --output-dir results
+"""
+from __future__ import division
+
+import argparse
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+import bda
+import divide_dollar_bda
+import hall_of_fame
+import stats_sink
+
+
+def checkpoint_path(output_dir, run):
+    """Return path of the checkpoint marking run as finished."""
+    return os.path.join(output_dir, 'run-%i.done' % run)
+
+
+def pending_runs(output_dir, runs):
+    """Return runs without a checkpoint in output_dir."""
+    return [run for run in runs if not os.path.exists(checkpoint_path(output_dir, run))]
+
+
+def seed_run(seed, run):
+    """Seed the random generators of a worker for one run (entropy if seed is None)."""
+    if seed is None:
+        np.random.seed()
+        random.seed()
+    else:
+        np.random.seed([seed, run])
+        random.seed(np.random.randint(2**31))
+
+
+def evolve_run(args):
+    """Evolve one run (runs in a worker process) and return its statistics records."""
+    run, seed, output_dir = args
+    seed_run(seed, run)
+    start = time.time()
+    sink = stats_sink.StatsSink()
+    divide_dollar_bda.run_evolution(run, sink, output_dir=output_dir)
+    return output_dir, run, sink.records(), time.time() - start
+
+
+def write_checkpoint(output_dir, run, elapsed):
+    """Atomically mark run as finished."""
+    path = checkpoint_path(output_dir, run)
+    with open(path + '.tmp', 'w') as done_file:
+        done_file.write('%.2f minutes\n' % (elapsed / 60))
+    os.rename(path + '.tmp', path)
+
+
+def evolve_pool(evolve, jobs, processes, sinks):
+    """Evolve jobs across a process pool; record and checkpoint every run as it finishes.
+
+    evolve(job) runs in a worker process and returns (run_dir, run, records, elapsed): the
+    run's statistics records go to sinks[run_dir] and its checkpoint to run_dir. If a worker
+    fails (or on KeyboardInterrupt), the pool is terminated and the error re-raised; finished
+    runs keep their checkpoints.
+    """
+    pool = multiprocessing.Pool(processes)
+    try:
+        for run_dir, run, records, elapsed in pool.imap_unordered(evolve, jobs):
+            # Checkpoint only once the run's statistics are on disk
+            sinks[run_dir].extend(records)
+            sinks[run_dir].flush()
+            write_checkpoint(run_dir, run, elapsed)
+            print('%s: run %i done' % (run_dir, run))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def archive_populations(output_dir, runs):
+    """Pack the final populations of runs into one (num_runs, pop_size, num_states) archive."""
+    genomes = [bda.load_genomes(os.path.join(output_dir, 'pop-%i.npy' % run)) for run in runs]
+    bda.save_population(os.path.join(output_dir, 'populations.npy'), np.stack(genomes))
+
+
+def merge_halls_of_fame(output_dir, runs):
+    """Merge the hall-of-fame archives of runs into one hall_of_fame.npy."""
+    hof = hall_of_fame.HallOfFame(divide_dollar_bda.bda_states, divide_dollar_bda.hall_of_fame_size)
+    for run in runs:
+        hof.merge(np.load(os.path.join(output_dir, 'hof-%i.npy' % run)))
+    hof.save(os.path.join(output_dir, 'hall_of_fame.npy'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=divide_dollar_bda.num_runs,
+                        help='number of independent runs')
+    parser.add_argument('--first-run', type=int, default=0, help='index of the first run')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='base seed; run i is seeded with (seed, i)')
+    parser.add_argument('--output-dir', default='.', help='directory for per-run output files')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    runs = xrange(args.first_run, args.first_run + args.runs)
+    todo = pending_runs(args.output_dir, runs)
+    print('%i runs, %i already done' % (len(runs), len(runs) - len(todo)))
+
+    start = time.time()
+    sink = stats_sink.StatsSink(os.path.join(args.output_dir, 'stats.bin'))
+    jobs = [(run, args.seed, args.output_dir) for run in todo]
+    evolve_pool(evolve_run, jobs, args.processes, {args.output_dir: sink})
+    archive_populations(args.output_dir, runs)
+    if divide_dollar_bda.hall_of_fame_size > 0:
+        merge_halls_of_fame(args.output_dir, runs)
+    print('%.2f minutes' % ((time.time() - start) / 60))
+
+
+if __name__ == '__main__':
+    main()
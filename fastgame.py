@@ -0,0 +1,265 @@
+"""Pure-Python engine for single games of divide-the-dollar.
+
+For one game, or a handful, the per-call overhead of NumPy (and of the dict-backed game.Hand
+and bda.State objects) dominates the actual work. This engine plays one game at a time with
+slotted objects and tuples: a hand is a tuple of per-value card counts, whose summary, plays and
+draws are looked up in tables that fill as games are played, and a BDA is a tuple of state
+tuples. Agents are stepped like agents.BDAAgent.decide, with the automaton state of each seat
+kept by the game, so it plays exactly the games of batch_game.play_games (also when an agent
+plays itself). Selecting it with divide_dollar_bda.engine = 'python' makes round_robin below
+replace the batched round-robin.
+
+Usage:
+    game = FastGame(cards, hand_size)
+    p1_score, p2_score = game.play(FastBDA.from_bda(p1), FastBDA.from_bda(p2), deck)
+"""
+from __future__ import division
+
+import numpy as np
+
+import batch_game
+import bda
+import instrument
+
+
+class Lookup(dict):
+    """Table that computes and stores a missing entry as function(key)."""
+
+    __slots__ = ('function',)
+
+    def __init__(self, function):
+        """Initialize empty table."""
+        dict.__init__(self)
+        self.function = function
+
+    def __missing__(self, key):
+        value = self[key] = self.function(key)
+        return value
+
+
+def card_at(counts, position):
+    """Return the card index at position of the sorted hand of per-value counts."""
+    for card, count in enumerate(counts):
+        if position < count:
+            return card
+        position -= count
+    raise IndexError('Hand position out of range.')
+
+
+def pick_card(counts, action, value_showing, values, median):
+    """Return the card index action plays from a hand (value_showing 0: playing first).
+
+    Same choices as divide_dollar_bda.play_action: going first, the smallest, median or largest
+    card; going second, spoil with the smallest card that pushes the total over 1.0 (largest if
+    none does), the median, or maximize with the largest card that keeps the total within 1.0
+    (smallest if none does).
+    """
+    held = [card for card, count in enumerate(counts) if count]
+    if action == 1:
+        return card_at(counts, median)
+    elif value_showing == 0:
+        return held[0] if action == 0 else held[-1]
+    elif action == 0:
+        return next((card for card in held if values[card] + value_showing > 1.0), held[-1])
+    return next((card for card in reversed(held) if values[card] + value_showing <= 1.0), held[0])
+
+
+def changed(counts, card, change):
+    """Return the hand of per-value counts with change cards of index card added."""
+    return counts[:card] + (counts[card] + change,) + counts[card + 1:]
+
+
+class FastBDA(object):
+    """BDA compiled into tuples: one (decision_index, decision_type, threshold, actions,
+    transitions) tuple per state.
+
+    Takes the same decisions as bda.BDA.step; hot-path profile counters are not kept.
+
+    Args:
+        records (array): GENOME_DTYPE records of the BDA's states
+
+    """
+
+    __slots__ = ('states',)
+
+    def __init__(self, records):
+        """Compile the BDA's states."""
+        self.states = tuple((index, test, threshold, tuple(actions), tuple(transitions))
+                            for index, test, actions, transitions, threshold in records.tolist())
+
+    @classmethod
+    def from_bda(cls, agent):
+        return cls(agent.to_records())
+
+    def step(self, current_state, sim_state):
+        """Return the action for sim_state and the next automaton state."""
+        states = self.states
+        for _ in xrange(bda.MAX_TRANSITIONS + 1):
+            index, test, threshold, actions, transitions = states[current_state]
+            value = sim_state[index]
+            if test == 0:
+                passed = value > threshold
+            elif test == 1:
+                passed = value < threshold
+            else:
+                passed = test == 2 and abs(value - threshold) < bda.NEAR
+            if passed:
+                return actions[0], transitions[0]
+            current_state = transitions[1]
+        actions, transitions = states[current_state][3:]
+        return actions[1], transitions[1]
+
+
+class FastPolicy(object):
+    """Monte Carlo optimal_policy over the game states of a game.CardGame (no internal state).
+
+    Args:
+        policy (array): action to take in each state index
+        card_game (CardGame): game whose state lookup maps hands to state indices
+
+    """
+
+    __slots__ = ('policy', 'showing_index', 'num_cards', 'state_index')
+
+    def __init__(self, policy, card_game):
+        """Copy the policy and state lookup into lists."""
+        self.policy = np.asarray(policy).tolist()
+        self.num_cards = card_game.deck.unique_cards
+        self.showing_index = dict((value, i) for i, value in enumerate(card_game.card_values))
+        self.state_index = card_game.true_state_index.tolist()
+
+    def step(self, current_state, sim_state):
+        """Return the action for sim_state; the internal state is unchanged."""
+        n = self.num_cards
+        showing = self.showing_index.get(sim_state[0], n)
+        state_index = self.state_index[((showing * n + sim_state[1]) * n + sim_state[2]) * n
+                                       + sim_state[3]]
+        return self.policy[state_index], current_state
+
+
+class FastGame(object):
+    """Divide-the-dollar between two agents with step(state, sim_state), one game at a time.
+
+    Args:
+        cards (list): value of each unique card
+        hand_size (int): number of cards in a player's hand
+
+    Attributes:
+        summaries (Lookup): {hand: (smallest, median, largest)}
+        plays (Lookup): {(hand, action, value_showing): (card played, hand left)}
+        draws (Lookup): {(hand, card): hand after drawing card}
+
+    """
+
+    __slots__ = ('cards', 'hand_size', 'summaries', 'plays', 'draws')
+
+    def __init__(self, cards, hand_size):
+        """Initialize game with empty lookup tables."""
+        self.cards = tuple(cards)
+        self.hand_size = hand_size
+        median = hand_size // 2
+        self.summaries = Lookup(lambda counts: (card_at(counts, 0), card_at(counts, median),
+                                                card_at(counts, sum(counts) - 1)))
+        self.plays = Lookup(self._play)
+        self.draws = Lookup(lambda key: changed(key[0], key[1], 1))
+
+    def _play(self, key):
+        counts, action, value_showing = key
+        card = pick_card(counts, action, value_showing, self.cards, self.hand_size // 2)
+        return card, changed(counts, card, -1)
+
+    def deal(self, cards):
+        """Return the hand of per-value counts holding cards."""
+        counts = [0] * len(self.cards)
+        for card in cards:
+            counts[card] += 1
+        return tuple(counts)
+
+    def play(self, p1, p2, deck):
+        """Play one game on a shuffled deck of card indices; return the scores of p1 and p2."""
+        values = self.cards
+        hand_size = self.hand_size
+        summaries = self.summaries
+        plays = self.plays
+        draws = self.draws
+        deck = deck.tolist() if isinstance(deck, np.ndarray) else deck
+        deck_size = len(deck)
+        players = (p1, p2)
+        hands = [self.deal(deck[:hand_size]), self.deal(deck[hand_size:2 * hand_size])]
+        agent_states = [0, 0]
+        played = [0, 0]
+        scores = [0, 0]
+        num_deals = 0
+        next_card = 2 * hand_size
+
+        for round_index in xrange(1 + (deck_size - 2 * hand_size) // 2):
+            fraction = num_deals / (round_index + 1)
+            value_showing = 0
+            for turn, player in enumerate((0, 1) if round_index % 2 == 0 else (1, 0)):
+                hand = hands[player]
+                smallest, median, largest = summaries[hand]
+                action, agent_states[player] = players[player].step(
+                    agent_states[player], [value_showing, smallest, median, largest, fraction, turn])
+                card, hands[player] = plays[hand, action, value_showing]
+                played[player] = value_showing = values[card]
+
+            # Both players score only if the cards played don't exceed the dollar
+            if played[0] + played[1] <= 1:
+                scores[0] += played[0]
+                scores[1] += played[1]
+                num_deals += 1
+
+            for player in (0, 1):
+                if next_card < deck_size:
+                    hands[player] = draws[hands[player], deck[next_card]]
+                    next_card += 1
+
+        return scores[0], scores[1]
+
+
+def population_bdas(population, members=None):
+    """Return a FastBDA for each member of a BDAPopulation (all members by default)."""
+    return [FastBDA(records) for records in population.to_records(members)]
+
+
+def play_games(decks, p1_agents, p2_agents, cards, hand_size):
+    """Play game g between p1_agents[g] and p2_agents[g] on decks[g], like batch_game.play_games.
+
+    Returns:
+        (tuple): score of player 1 and player 2 in each game
+
+    """
+    game = FastGame(cards, hand_size)
+    scores = np.array([game.play(p1, p2, deck)
+                       for p1, p2, deck in zip(p1_agents, p2_agents, decks.tolist())],
+                      dtype=float).reshape(len(decks), 2)
+    return scores[:, 0], scores[:, 1]
+
+
+def round_robin(agents, pop_size, rand_pop_size, num_episodes, num_of_unique_cards, cards,
+                hand_size, rng=np.random):
+    """batch_game.round_robin, with the games played one at a time by FastGame.
+
+    The decks are drawn exactly as batch_game.round_robin draws them, so both engines return
+    the same statistics from the same random state.
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays over all agents
+
+    """
+    p1_members, p2_members = batch_game.matchup_members(
+        np.arange(pop_size), np.arange(pop_size, pop_size + rand_pop_size), num_episodes)
+    with instrument.timer('shuffle'):
+        decks = batch_game.shuffled_decks(len(p1_members), num_of_unique_cards, rng)
+    if isinstance(agents, bda.BDAPopulation):
+        fast_agents = population_bdas(agents)
+    else:
+        fast_agents = [FastBDA.from_bda(agent) for agent in agents]
+    p1_scores, p2_scores = play_games(decks, [fast_agents[m] for m in p1_members.tolist()],
+                                      [fast_agents[m] for m in p2_members.tolist()], cards,
+                                      hand_size)
+    if instrument.profile is not None:
+        instrument.profile.count('games', len(p1_members))
+    with instrument.timer('stats'):
+        return batch_game.match_stats(p1_members, p2_members, p1_scores, p2_scores,
+                                      len(fast_agents))
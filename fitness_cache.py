@@ -0,0 +1,111 @@
+"""Content-addressed cache of per-genome match statistics for the BDA round-robin."""
+from __future__ import division
+
+import collections
+import hashlib
+
+import numpy as np
+
+import batch_game
+
+STATS = ('games', 'wins', 'losses', 'plus_minus', 'score_earned', 'score_diff')
+
+
+def genome_key(encoding):
+    """Return the cache key of a genome from its write_bda encoding."""
+    return hashlib.sha1(encoding.encode('ascii')).hexdigest()
+
+
+class FitnessCache(object):
+    """LRU cache of accumulated match statistics keyed by genome hash.
+
+    Args:
+        max_size (int): number of genomes kept before the least recently used one is evicted
+
+    Attributes:
+        entries (OrderedDict): {genome_key: array of STATS totals}, least recently used first
+        hits (int): number of lookups that found a genome
+        misses (int): number of lookups that did not
+        evictions (int): number of genomes evicted
+
+    """
+
+    def __init__(self, max_size=1000):
+        """Initialize empty cache."""
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def lookup(self, key):
+        """Return accumulated STATS totals of a genome (None if not cached)."""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries[key] = entry  # most recently used
+        return entry
+
+    def add(self, key, stats):
+        """Add STATS totals of newly played games to a genome's accumulated samples."""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            entry = np.zeros(len(STATS))
+        entry += stats
+        self.entries[key] = entry
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def hit_rate(self):
+        """Return fraction of lookups that were hits."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+
+def cached_round_robin(cache, population, pop_size, rand_pop_size, num_episodes,
+                       refresh_episodes, num_of_unique_cards, cards, hand_size, rng=np.random):
+    """Round-robin that reuses cached samples of evolving genomes seen in earlier generations.
+
+    New genomes play num_episodes games against every random opponent, as in
+    batch_game.round_robin. Cached genomes only play refresh_episodes games against every
+    (fresh) random opponent, and those games are added to their accumulated samples. The
+    statistics of evolving agents are their accumulated per-game averages scaled to
+    rand_pop_size * num_episodes games, so they are comparable with an uncached round-robin.
+
+    Args:
+        cache (FitnessCache): cache of accumulated statistics
+        population (BDAPopulation): evolving agents [0, pop_size) followed by random agents
+        refresh_episodes (int): games a cached genome plays against each random opponent
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays over all agents
+
+    """
+    keys = [genome_key(population.write_bda(i)) for i in xrange(pop_size)]
+    cached = np.array([cache.lookup(key) is not None for key in keys], dtype=bool)
+
+    p2_agents = np.arange(pop_size, pop_size + rand_pop_size)
+    new_members = batch_game.matchup_members(np.flatnonzero(~cached), p2_agents, num_episodes)
+    old_members = batch_game.matchup_members(np.flatnonzero(cached), p2_agents, refresh_episodes)
+    p1_members = np.concatenate((new_members[0], old_members[0]))
+    p2_members = np.concatenate((new_members[1], old_members[1]))
+    stats = np.array(batch_game.play_matchups(population, p1_members, p2_members,
+                                              num_of_unique_cards, cards, hand_size, rng),
+                     dtype=float)
+
+    games = np.bincount(p1_members, minlength=population.pop_size)
+    schedule = rand_pop_size * num_episodes
+    for i, key in enumerate(keys):
+        totals = cache.add(key, np.concatenate(([games[i]], stats[:, i])))
+        stats[:, i] = totals[1:] / totals[0] * schedule
+    return tuple(stats)
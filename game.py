@@ -8,6 +8,9 @@ import numpy as np
 class Deck(object):
     """Deck.
 
+    The cards live in one preallocated list that is shuffled in place; dealing advances a
+    cursor through it instead of copying the rest of the deck.
+
     Args:
         cards (dict): {card_value: unique_cards}
 
@@ -15,7 +18,8 @@ class Deck(object):
         cards (dict): {card_value: num_cards}
         unique_cards (int): number of unique card values
         deck_size (int): total number of cards in the deck
-        current_deck (list): full list of cards remaining in deck
+        card_values (list): sorted unique card values; a card's index is its position here
+        next_card (int): position of the next card to deal in the shuffled deck
 
     """
 
@@ -24,21 +28,41 @@ class Deck(object):
         self.cards = cards
         self.unique_cards = len(self.cards)
         self.deck_size = sum(self.cards.values())
-        self.current_deck = self.shuffle_deck()
+        self.card_values = sorted(self.cards)
+        self._sorted_deck = []
+        for card in self.card_values:
+            self._sorted_deck += [card] * self.cards[card]
+        self._deck = list(self._sorted_deck)
+        self.next_card = 0
+        self.shuffle_deck()
+
+    @property
+    def current_deck(self):
+        """list: cards remaining in deck."""
+        return self._deck[self.next_card:]
+
+    @property
+    def num_cards_left(self):
+        """int: number of cards remaining in deck."""
+        return self.deck_size - self.next_card
 
     def shuffle_deck(self):
-        """Return shuffled deck of all cards."""
-        d = []
-        for card, num in zip(self.cards.keys(), self.cards.values()):
-            d += [card] * num
-        return np.random.permutation(np.array(d)).tolist()
+        """Shuffle all cards back into the deck (in place) and return the shuffled deck.
+
+        The deck is refilled in sorted order first, so the shuffle only depends on the state of
+        numpy's global random number generator (seeded by np.random.seed).
+        """
+        self._deck[:] = self._sorted_deck
+        np.random.shuffle(self._deck)
+        self.next_card = 0
+        return self._deck
 
     def deal_cards(self, num_cards_to_deal):
         """Deal N cards from top of deck."""
-        assert len(self.current_deck) >= num_cards_to_deal, \
+        assert self.num_cards_left >= num_cards_to_deal, \
             'Not enough cards left in deck to deal those cards.'
-        dealt_cards = self.current_deck[:num_cards_to_deal]
-        self.current_deck = self.current_deck[num_cards_to_deal:]
+        dealt_cards = self._deck[self.next_card:self.next_card + num_cards_to_deal]
+        self.next_card += num_cards_to_deal
         return dealt_cards
 
 
@@ -59,6 +83,12 @@ class CardGame(object):
         num_states (int): number of possible game states
         hand_size (int): number of cards a player holds in their hand
         num_rounds (int): number of rounds that are played in one game
+        card_values (list): sorted unique card values; a card's index is its position here
+        card_index (dict): {card_value: card_index}
+        state_dims (tuple): number of card indices for card_showing, smallest, median, largest
+        state_strides (array): flat-index stride of each entry of a game state
+        true_state_index (array): flat lookup from (card_showing, smallest, median, largest)
+            card indices to the index of that state, or -1 for invalid states
 
     """
 
@@ -75,6 +105,12 @@ class CardGame(object):
         self.hand_size = hand_size
         self.num_rounds = 1 + (self.deck.deck_size
                                - (self.num_players * self.hand_size)) // self.num_players
+        self.card_values = self.deck.card_values
+        self.card_index = dict((card, index) for index, card in enumerate(self.card_values))
+        self.state_dims = (self.deck.unique_cards + 1, self.deck.unique_cards,
+                           self.deck.unique_cards, self.deck.unique_cards)
+        self.state_strides = np.array([int(np.prod(self.state_dims[i + 1:]))
+                                       for i in xrange(len(self.state_dims))])
         self.true_state_index = self._true_state_index()
 
     def _true_state_index(self):
@@ -86,27 +122,165 @@ class CardGame(object):
         should be sequentially increasing.
 
         Returns:
-            (list): true state index of valid permutations
+            (array): true state index of valid permutations, indexed by the flattened
+                permutation (card_showing, smallest, median, largest)
+
+        """
+        states = np.indices(self.state_dims).reshape(len(self.state_dims), -1).T
+        valid = np.all(states[:, 1:-1] <= states[:, 2:], axis=1)
+        true_state_index = np.full(len(states), -1, dtype=np.int64)
+        true_state_index[valid] = np.arange(np.count_nonzero(valid))
+        return true_state_index
+
+    def encode_game_state(self, game_state):
+        """Convert a game state of card values into card indices.
+
+        A card_showing of 0 (no card showing) is encoded as index unique_cards.
+
+        Args:
+            game_state (list): [card_showing, smallest, median, largest] card values
+
+        Returns:
+            (list): [card_showing, smallest, median, largest] card indices
 
         """
-        states = []
+        card_showing = self.card_index.get(game_state[0], self.deck.unique_cards)
+        return [card_showing] + [self.card_index[card] for card in game_state[1:]]
+
+    def state_index(self, game_state):
+        """Return the true state index of one game state of card indices."""
+        card_showing, smallest, median, largest = game_state
         unique_cards = self.deck.unique_cards
-        for card_showing in xrange(unique_cards + 1):
-            for smallest in xrange(unique_cards):
-                for median in xrange(unique_cards):
-                    for largest in xrange(unique_cards):
-                        states.append(np.array([card_showing, smallest, median, largest]))
-
-        true_state_index = []
-        true_index_counter = 0
-        for state in states:
-            if np.all(state[1:-1] <= state[2:]):
-                true_state_index.append(true_index_counter)
-                true_index_counter += 1
+        return int(self.true_state_index[((card_showing * unique_cards + smallest) * unique_cards
+                                          + median) * unique_cards + largest])
+
+    def state_indices(self, game_states_array):
+        """Return the true state indices of many game states.
+
+        Args:
+            game_states_array (array): (num_states, 4) card indices
+                [card_showing, smallest, median, largest]
+
+        Returns:
+            (array): true state index of each game state
+
+        """
+        return self.true_state_index[np.dot(np.asarray(game_states_array), self.state_strides)]
+
+
+class Hand(object):
+    """Sorted hand of cards stored as per-value counts.
+
+    With only a few unique card values, every operation walks at most one entry per value, so
+    drawing, playing and looking up cards never sorts or copies the hand.
+
+    Args:
+        cards (iterable): initial cards in hand
+
+    Attributes:
+        values (list): sorted unique card values that have been held
+        counts (list): number of cards of each value currently held
+        size (int): number of cards in hand
+
+    """
+
+    def __init__(self, cards=()):
+        """Initialize hand."""
+        self.values = []
+        self.counts = []
+        self.size = 0
+        self.add(cards)
+
+    def add(self, cards):
+        """Add cards to hand."""
+        for card in cards:
+            for i, value in enumerate(self.values):
+                if value == card:
+                    self.counts[i] += 1
+                    break
+                elif value > card:
+                    self.values.insert(i, card)
+                    self.counts.insert(i, 1)
+                    break
             else:
-                true_state_index.append(-1)
+                self.values.append(card)
+                self.counts.append(1)
+            self.size += 1
+
+    def remove(self, card):
+        """Remove one card of value card from hand."""
+        i = self.values.index(card)
+        assert self.counts[i] > 0, 'Card is not in hand.'
+        self.counts[i] -= 1
+        self.size -= 1
+
+    def clear(self):
+        """Remove all cards from hand."""
+        self.counts = [0] * len(self.values)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position):
+        """Return card at position of the sorted hand (negative positions count from the end)."""
+        if position < 0:
+            position += self.size
+        if not 0 <= position < self.size:
+            raise IndexError('Hand position out of range.')
+        for value, count in zip(self.values, self.counts):
+            if position < count:
+                return value
+            position -= count
+
+    def __iter__(self):
+        for value, count in zip(self.values, self.counts):
+            for _ in xrange(count):
+                yield value
+
+    def tolist(self):
+        """Return sorted list of cards in hand."""
+        return list(self)
+
+    def smallest(self):
+        """Return smallest card in hand."""
+        return self[0]
+
+    def median(self):
+        """Return median card in hand."""
+        return self[self.size // 2]
+
+    def largest(self):
+        """Return largest card in hand."""
+        return self[-1]
+
+    def spoil(self, card_showing, card_values=None):
+        """Return smallest card that pushes the total over 1.0, or the largest card if none does.
+
+        Args:
+            card_showing (float): value of the card showing
+            card_values (list): value of each card, if the hand holds card indices
 
-        return true_state_index
+        """
+        for value, count in zip(self.values, self.counts):
+            card_value = value if card_values is None else card_values[value]
+            if count and card_value + card_showing > 1.0:
+                return value
+        return self.largest()
+
+    def maximize(self, card_showing, card_values=None):
+        """Return largest card that keeps the total within 1.0, or the smallest card if none does.
+
+        Args:
+            card_showing (float): value of the card showing
+            card_values (list): value of each card, if the hand holds card indices
+
+        """
+        for value, count in zip(reversed(self.values), reversed(self.counts)):
+            card_value = value if card_values is None else card_values[value]
+            if count and card_value + card_showing <= 1.0:
+                return value
+        return self.smallest()
 
 
 class Player(object):
@@ -117,7 +291,7 @@ class Player(object):
 
     Attributes:
         policy (list): the player's optimal policy for choosing action when in state
-        hand (list): the player's cards in hand
+        hand (Hand): the player's cards in hand
         game_state (array): the current state of the game
         next_action: the player's chosen action to play next turn
         last_card_played (float): the value of the last card played
@@ -129,7 +303,7 @@ class Player(object):
     def __init__(self, policy):
         """Initialize player."""
         self.policy = policy
-        self.hand = []
+        self.hand = Hand()
         self.game_state = None
         self.next_action = None
         self.last_card_played = None
@@ -143,19 +317,26 @@ class Player(object):
     def pick_up_cards(self, cards):
         """Add cards (list or tuple) to player's hand."""
         assert isinstance(cards, list) or isinstance(cards, tuple)
-        self.hand = np.sort(self.hand + cards).tolist()
+        self.hand.add(cards)
 
     def play_card(self, card_position_in_hand):
         """Play specific card in hand."""
-        card_value = self.hand[card_position_in_hand]
-        self.hand = np.delete(self.hand, 0).tolist()
+        return self.play_value(self.hand[card_position_in_hand])
+
+    def play_value(self, card_value):
+        """Play a card of value card_value from hand."""
+        self.hand.remove(card_value)
         self.last_card_played = card_value
         return card_value
 
     def set_game_state(self, card_showing):
         """TODO: Remove this method; not appropriate for player class."""
-        median_card_index = len(self.hand) // 2
-        self.game_state = [card_showing, self.hand[0], self.hand[median_card_index], self.hand[-1]]
+        self.game_state = [card_showing, self.hand.smallest(), self.hand.median(),
+                           self.hand.largest()]
+
+    def reset_hand(self):
+        """Discard all cards in player's hand."""
+        self.hand.clear()
 
     def reset_score(self):
         """Reset player's score to zero."""
@@ -0,0 +1,160 @@
+"""Hall of fame of the best BDAs across generations and runs, and fixed opponent pools.
+
+A hall of fame is one structured array with a row per archived BDA: where it was found (run,
+generation, population member), its fitness, and its genome as packed bda.GENOME_DTYPE
+records. Saved as a .npy file it loads memory-mapped, and archives of many runs merge into one.
+
+An OpponentPool is a fixed set of opponents, e.g. a hall of fame, whose decisions are compiled
+into lookup tables once (bda.BDAPopulation.decision_tables) and reused every generation.
+"""
+from __future__ import division
+
+import numpy as np
+
+import batch_game
+import bda
+
+
+def hof_dtype(num_states):
+    """Return the row dtype of a hall of fame of BDAs with num_states states."""
+    return np.dtype([('run', '<i4'), ('gen', '<i4'), ('member', '<i4'), ('fitness', '<f8'),
+                     ('genome', bda.GENOME_DTYPE, (num_states,))])
+
+
+def best_entries(entries, max_size):
+    """Return the max_size fittest entries, best first, keeping one entry per genome."""
+    entries = entries[np.argsort(-entries['fitness'], kind='mergesort')]
+    seen = set()
+    unique = []
+    for i, genome in enumerate(entries['genome']):
+        key = genome.tobytes()
+        if key not in seen:
+            seen.add(key)
+            unique.append(i)
+    return entries[unique[:max_size]]
+
+
+def read_genomes(path, size=None):
+    """Return the first size genomes of a hall of fame, population or archive .npy file.
+
+    Returns:
+        (array): (size, num_states) GENOME_DTYPE records (memory-mapped)
+
+    """
+    genomes = np.load(path, mmap_mode='r')
+    if genomes.dtype.names is not None and 'genome' in genomes.dtype.names:
+        genomes = genomes['genome']
+    return genomes.reshape(-1, genomes.shape[-1])[:size]
+
+
+class HallOfFame(object):
+    """Archive of the fittest distinct BDAs seen so far.
+
+    Args:
+        num_states (int): number of states of the archived BDAs
+        max_size (int): number of BDAs kept
+
+    Attributes:
+        entries (array): hof_dtype rows, fittest first
+
+    """
+
+    def __init__(self, num_states, max_size=100):
+        """Initialize empty archive."""
+        self.num_states = num_states
+        self.max_size = max_size
+        self.entries = np.zeros(0, dtype=hof_dtype(num_states))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, population, members, fitness, run, gen):
+        """Offer population members with their fitness; the archive keeps the fittest."""
+        members = np.asarray(members)
+        new = np.zeros(len(members), dtype=self.entries.dtype)
+        new['run'] = run
+        new['gen'] = gen
+        new['member'] = members
+        new['fitness'] = fitness
+        new['genome'] = population.to_records(members)
+        self.merge(new)
+
+    def merge(self, entries):
+        """Merge hof_dtype rows (e.g. another run's archive) into this one."""
+        self.entries = best_entries(np.concatenate((self.entries, entries)), self.max_size)
+
+    def population(self, size=None):
+        """Return the size fittest archived BDAs as a BDAPopulation."""
+        return bda.BDAPopulation.from_records(self.entries['genome'][:size])
+
+    def save(self, path):
+        with open(path, 'wb') as hof_file:
+            np.save(hof_file, self.entries)
+
+    @classmethod
+    def load(cls, path, max_size=None):
+        """Load an archive (memory-mapped until it is changed)."""
+        entries = np.load(path, mmap_mode='r')
+        hof = cls(entries['genome'].shape[1], len(entries) if max_size is None else max_size)
+        hof.entries = entries[:hof.max_size]
+        return hof
+
+
+class OpponentPool(object):
+    """Fixed opponents with precompiled decision tables.
+
+    Args:
+        population (BDAPopulation): the opponents
+        cards (list): sorted value of each unique card
+        num_rounds (int): number of rounds of a game
+
+    """
+
+    def __init__(self, population, cards, num_rounds):
+        """Compile the opponents' decisions for the game."""
+        self.population = population
+        self.cards = cards
+        self.tables = population.decision_tables(cards, num_rounds)
+
+    def __len__(self):
+        return self.population.pop_size
+
+    def policy(self, members):
+        """Return the batch policy of opponents members, one per game."""
+        return batch_game.TablePolicy(self.tables, members, self.cards)
+
+    @classmethod
+    def random(cls, size, num_states, cards, num_rounds, rng=np.random):
+        """Return a pool of size random BDAs."""
+        population = bda.BDAPopulation(size, num_states)
+        population.randomize(rng=rng)
+        return cls(population, cards, num_rounds)
+
+    @classmethod
+    def load(cls, path, cards, num_rounds, size=None):
+        """Return a pool of the first size BDAs of a hall of fame or saved population file."""
+        return cls(bda.BDAPopulation.from_records(read_genomes(path, size)), cards, num_rounds)
+
+
+def pool_round_robin(population, pop_size, opponents, rand_pop_size, num_episodes,
+                     num_of_unique_cards, cards, hand_size, rng=np.random):
+    """Play every evolving agent against every opponent of a fixed pool, num_episodes games each.
+
+    The evolving agents [0, pop_size) of population sit as player 1. Their statistics are
+    scaled to rand_pop_size opponents, so they are comparable with batch_game.round_robin
+    whatever the size of the pool; the statistics of all other agents are 0.
+
+    Returns:
+        (tuple): wins, losses, plus_minus, score_earned, score_diff arrays over population
+
+    """
+    p1_members, p2_members = batch_game.matchup_members(np.arange(pop_size),
+                                                        np.arange(len(opponents)), num_episodes)
+    decks = batch_game.shuffled_decks(len(p1_members), num_of_unique_cards, rng)
+    p1_scores, p2_scores = batch_game.play_games(
+        decks, batch_game.PopulationPolicy(population, p1_members), opponents.policy(p2_members),
+        cards, hand_size)
+    num_agents = population.pop_size
+    stats = batch_game.match_stats(p1_members, p2_members + num_agents, p1_scores, p2_scores,
+                                   num_agents + len(opponents))
+    return tuple(stat[:num_agents] * rand_pop_size / len(opponents) for stat in stats)
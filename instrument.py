@@ -0,0 +1,119 @@
+"""Opt-in counters and timers for the game hot paths.
+
+Instrumentation is off by default. Hot paths only check `instrument.profile is not None`
+before touching any counter or clock, so they cost nothing measurable until enable() is
+called. Only work done in the current process is recorded (not in worker pools).
+
+Usage:
+    profile = instrument.enable()
+    ...  # play games, evolve generations
+    profile.dump('profile-0.txt', gen)
+"""
+from __future__ import division
+
+import collections
+import json
+import time
+
+profile = None
+
+
+class Profile(object):
+    """Counters and accumulated timers.
+
+    Attributes:
+        counters (dict): {name: count}
+        timers (dict): {name: seconds}
+
+    """
+
+    def __init__(self):
+        """Initialize empty profile."""
+        self.counters = collections.defaultdict(int)
+        self.timers = collections.defaultdict(float)
+
+    def count(self, name, n=1):
+        """Add n to counter name."""
+        self.counters[name] += int(n)
+
+    def add_time(self, name, seconds):
+        """Add seconds to timer name."""
+        self.timers[name] += seconds
+
+    def count_transitions(self, transitions, max_hit, n=1):
+        """Record n BDA decisions that took transitions internal transitions."""
+        self.counters['bda_decisions'] += int(n)
+        self.counters['bda_transitions'] += int(transitions * n)
+        self.counters['bda_transitions_%i' % transitions] += int(n)
+        if max_hit:
+            self.counters['bda_max_transitions_hit'] += int(n)
+
+    def summary(self):
+        """Return counters and timers as plain dicts."""
+        return {'counters': dict(self.counters), 'timers': dict(self.timers)}
+
+    def reset(self):
+        """Clear all counters and timers."""
+        self.counters.clear()
+        self.timers.clear()
+
+    def dump(self, path, gen):
+        """Append this profile as one JSON line tagged with gen to path."""
+        record = self.summary()
+        record['gen'] = gen
+        with open(path, 'a') as profile_file:
+            profile_file.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+class NullTimer(object):
+    """Context manager that does nothing (shared by all timers while instrumentation is off)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer(object):
+    """Context manager adding the elapsed time of its block to a timer of a profile."""
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.add_time(self.name, time.time() - self.start)
+        return False
+
+
+def timer(name):
+    """Return a context manager timing its block under name (the shared NULL_TIMER if disabled).
+
+    Timers nest: an outer timer such as 'evaluation' includes the time of the timers inside it,
+    so every label should time one kind of work only.
+    """
+    if profile is None:
+        return NULL_TIMER
+    return Timer(profile, name)
+
+
+def enable():
+    """Turn instrumentation on and return the new profile."""
+    global profile
+    profile = Profile()
+    return profile
+
+
+def disable():
+    """Turn instrumentation off."""
+    global profile
+    profile = None
@@ -0,0 +1,190 @@
+"""Island-model evolution of BDA agents: several populations evolve concurrently and migrate.
+
+Every island is one worker process running divide_dollar_bda.run_evolution on its own
+population, so every setting of a single run applies per island (opponents, fitness cache, hall
+of fame, profiling). Every migration interval, each island sends copies of its best genomes
+(packed bda.GENOME_DTYPE records) to its neighbours over a queue; arriving migrants replace the island's worst
+members. The migration plan is drawn up front by the parent, so with a seed a run only depends
+on the seed and the settings, never on process scheduling.
+
+Each island writes run_evolution's output files to run-<run>/, named by its island index
+(pop-<island>.txt and .npy, and hof-/profile- files if enabled). Fitness statistics are
+appended to islands-<run>.bin (records' run field is the island index) and the final
+populations of all islands to pop-<run>.txt, best first.
+
+Usage:
+    python islands.py --islands 8 --interval 10 --migrants 2 --topology ring --seed 1
+"""
+from __future__ import division
+
+import argparse
+import multiprocessing
+import os
+import random
+import time
+import traceback
+
+import numpy as np
+
+import divide_dollar_bda
+import stats_sink
+
+TOPOLOGIES = ('ring', 'random', 'full')
+
+
+def migration_targets(topology, num_islands, rng=np.random):
+    """Return the destination islands of every island for one migration.
+
+    ring sends to the next island, random to one other island drawn from rng, full to all
+    other islands.
+    """
+    islands = np.arange(num_islands)
+    if num_islands < 2:
+        return [[] for _ in islands]
+    if topology == 'ring':
+        return [[int((i + 1) % num_islands)] for i in islands]
+    elif topology == 'random':
+        offsets = rng.randint(1, num_islands, num_islands)
+        return [[int((i + offset) % num_islands)] for i, offset in zip(islands, offsets)]
+    elif topology == 'full':
+        return [[int(j) for j in islands if j != i] for i in islands]
+    raise ValueError('unknown topology %r (expected one of %s)' % (topology, ', '.join(TOPOLOGIES)))
+
+
+def migration_plan(topology, num_islands, num_migrations, rng=np.random):
+    """Return migration_targets of every migration of a run."""
+    return [migration_targets(topology, num_islands, rng) for _ in xrange(num_migrations)]
+
+
+def migrate(bda_pop, fit, island, targets, inboxes, num_migrants, keep=()):
+    """Send this island's best genomes to its targets and take in the migrants sent to it.
+
+    Members in keep (e.g. the children bred this generation, whose fitness is not known yet)
+    are neither sent nor replaced: the fittest other members emigrate, and migrants replace the
+    island's lowest-fitness other members.
+
+    Returns:
+        (array): members that were replaced
+    """
+    ranked = [i for i in np.argsort(fit, kind='mergesort') if i not in keep]
+    best = np.array(ranked[::-1][:num_migrants], dtype=int)
+    genomes = bda_pop.to_records(best)
+    for dest in targets[island]:
+        inboxes[dest].put((island, genomes))
+
+    num_sources = sum(island in dests for dests in targets)
+    arrivals = sorted((inboxes[island].get() for _ in xrange(num_sources)),
+                      key=lambda arrival: arrival[0])  # order by source island
+    migrants = np.concatenate([genomes for _, genomes in arrivals]) if arrivals else genomes[:0]
+
+    worst = np.array([i for i in ranked if i not in keep and i not in best][:len(migrants)], dtype=int)
+    bda_pop.set_records(worst, migrants[:len(worst)])
+    return worst
+
+
+def evolve_island(island, run, seed, plan, interval, num_migrants, inboxes, results, config,
+                  output_dir):
+    """Evolve one island (runs in a worker process) and put its result on the results queue."""
+    def migration(gen, bda_pop, fit, children):
+        if interval and (gen+1) % interval == 0:
+            migrate(bda_pop, fit, island, plan[(gen+1)//interval - 1], inboxes, num_migrants,
+                    keep=children)
+
+    try:
+        if seed is None:
+            np.random.seed()
+            random.seed()
+        else:
+            np.random.seed([seed, run, island])
+            random.seed(np.random.randint(2**31))
+
+        sink = stats_sink.StatsSink()
+        bda_pop, fit, plus_minus, score_earned, score_diff = divide_dollar_bda.run_evolution(
+            island, sink, output_dir=output_dir, config=config, migrate=migration)
+        final = (fit, plus_minus, score_earned, score_diff,
+                 [bda_pop.print_bda(i) for i in xrange(len(fit))])
+        results.put((island, sink.records(), final, None))
+    except Exception:
+        results.put((island, None, None, traceback.format_exc()))
+
+
+def run_islands(run, num_islands, interval, num_migrants, topology, seed=None, output_dir='.',
+                config=None):
+    """Evolve num_islands populations concurrently for one run and write its output files.
+
+    config is a divide_dollar_bda evolve() config (default: the module settings).
+    """
+    config = divide_dollar_bda.resolve_config(config)
+    num_migrations = (config['num_gens'] - 1) // interval if interval else 0
+    rng = np.random.RandomState(None if seed is None else [seed, run])
+    plan = migration_plan(topology, num_islands, num_migrations, rng)
+    island_dir = os.path.join(output_dir, 'run-%i' % run)
+    if not os.path.isdir(island_dir):
+        os.makedirs(island_dir)
+
+    inboxes = [multiprocessing.Queue() for _ in xrange(num_islands)]
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=evolve_island,
+                                       args=(island, run, seed, plan, interval, num_migrants,
+                                             inboxes, results, config, island_dir))
+               for island in xrange(num_islands)]
+    for worker in workers:
+        worker.start()
+    try:
+        finished = {}
+        for _ in xrange(num_islands):
+            island, records, final, error = results.get()
+            if error is not None:
+                raise RuntimeError('island %i failed:\n%s' % (island, error))
+            finished[island] = (records, final)
+    finally:
+        for worker in workers:
+            if worker.is_alive() and len(finished) < num_islands:
+                worker.terminate()
+            worker.join()
+
+    sink = stats_sink.StatsSink(os.path.join(output_dir, 'islands-%i.bin' % run))
+    members = []
+    for island in xrange(num_islands):
+        records, (fit, plus_minus, score_earned, score_diff, bdas) = finished[island]
+        sink.extend(records)
+        members += [(fit[i], plus_minus[i], score_earned[i], score_diff[i], island, bdas[i])
+                    for i in xrange(len(fit))]
+    sink.close()
+
+    pop_file = open(os.path.join(output_dir, 'pop-%i.txt' % run), 'w')
+    for member in sorted(members, key=lambda member: -member[0]):
+        pop_file.write('%.6f -fitness (%i %.2f %.2f) -island %i\n%s\n\n' % member)
+    pop_file.close()
+    return finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--islands', type=int, default=multiprocessing.cpu_count(),
+                        help='number of islands, one worker process each (default: one per core)')
+    parser.add_argument('--interval', type=int, default=10,
+                        help='generations between migrations (0 = isolated islands)')
+    parser.add_argument('--migrants', type=int, default=2,
+                        help='best genomes an island sends to each neighbour')
+    parser.add_argument('--topology', choices=TOPOLOGIES, default='ring',
+                        help='which islands receive an island\'s migrants')
+    parser.add_argument('--runs', type=int, default=1, help='number of independent runs')
+    parser.add_argument('--first-run', type=int, default=0, help='index of the first run')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='base seed; island j of run i is seeded with (seed, i, j)')
+    parser.add_argument('--output-dir', default='.', help='directory for per-run output files')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    start = time.time()
+    for run in xrange(args.first_run, args.first_run + args.runs):
+        print('run %i: %i islands x %i agents' % (run, args.islands, divide_dollar_bda.pop_size))
+        run_islands(run, args.islands, args.interval, args.migrants, args.topology, args.seed,
+                    args.output_dir)
+    print('%.2f minutes' % ((time.time() - start) / 60))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 from __future__ import division
 
+import json
+import os
+
 import numpy as np
 
 
@@ -18,6 +21,7 @@ class MonteCarloLearning(object):
         state_action_reward_sum (array): sum of rewards for each state-action pair
         state_action_count (array): number of times each state-action pair has been seen
         states_seen (list): all states seen by the agent during the current game
+        actions_taken (list): action taken by the agent in each state seen
 
     """
 
@@ -33,6 +37,7 @@ class MonteCarloLearning(object):
         self.state_action_reward_sum = np.zeros((self.num_states, self.num_actions))
         self.state_action_count = np.zeros((self.num_states, self.num_actions))
         self.states_seen = []
+        self.actions_taken = []
 
     def update(self, state_index, action_index, reward):
         """Update statistics for action value function Q.
@@ -53,6 +58,38 @@ class MonteCarloLearning(object):
         self.optimal_policy[state_index] = np.argmax(self.Q[state_index])
         return self.optimal_policy
 
+    def update_batch(self, state_indices, action_indices, rewards):
+        """Update statistics for action value function Q from many (state, action, reward) returns.
+
+        Equivalent to calling update once per return, but accumulates all returns at once and
+        recomputes Q and optimal_policy only for the states that were touched.
+
+        Args:
+            state_indices (array): array index of each state
+            action_indices (array): array index of each action
+            rewards (array): reward of each return (or one reward shared by all returns)
+
+        """
+        state_indices = np.asarray(state_indices, dtype=np.intp)
+        action_indices = np.asarray(action_indices, dtype=np.intp)
+        rewards = np.broadcast_to(np.asarray(rewards, dtype=float), state_indices.shape)
+        if state_indices.size == 0:
+            return self.optimal_policy
+        assert state_indices.max() < self.num_states, 'Invalid state (does not exist).'
+        assert action_indices.max() < self.num_actions, 'Invalid action (does not exist).'
+
+        touched, returns = np.unique(state_indices * self.num_actions + action_indices,
+                                     return_inverse=True)
+        count = self.state_action_count.reshape(-1)
+        reward_sum = self.state_action_reward_sum.reshape(-1)
+        count[touched] += np.bincount(returns)
+        reward_sum[touched] += np.bincount(returns, weights=rewards.ravel())
+        self.Q.reshape(-1)[touched] = reward_sum[touched] / count[touched]
+
+        touched_states = np.unique(touched // self.num_actions)
+        self.optimal_policy[touched_states] = np.argmax(self.Q[touched_states], axis=1)
+        return self.optimal_policy
+
     def record_state_seen(self, game_state):
         """Add game_state to list of states seen by player.
 
@@ -62,25 +99,64 @@ class MonteCarloLearning(object):
         """
         self.states_seen.append(np.array(game_state))
 
+    def record_action_taken(self, action_index):
+        """Add action taken in the last state seen to list of actions taken."""
+        self.actions_taken.append(action_index)
+
     def clear_states_seen(self):
-        """Clear list of states seen."""
+        """Clear lists of states seen and actions taken."""
         self.states_seen = []
+        self.actions_taken = []
 
-    def save_learning(self, episode):
-        """Save current information about Monte Carlo learning to .txt files.
+    def save_learning(self, episode, path=None, **metadata):
+        """Save current information about Monte Carlo learning to one compressed checkpoint.
+
+        The checkpoint is written to a temporary file first and then renamed, so a reader (or a
+        crash) never sees a partial file.
 
         Args:
             episode (int): number of training episodes elapsed
+            path (str): checkpoint file (default: mc-<episode>.npz)
+            **metadata: extra JSON-serializable information to store with the checkpoint
 
         Outputs:
             Q: action values
             optimal_policy: best optimal_policy
             state_action_count: number of times each state-action pair has been encountered
             state_action_reward_sum: sum of rewards for each state-action pair
+            episode, metadata: training progress and user information
+
+        Returns:
+            (str): path of the checkpoint
+
+        """
+        if path is None:
+            path = 'mc-%i.npz' % episode
+        with open(path + '.tmp', 'wb') as checkpoint_file:
+            np.savez_compressed(checkpoint_file, Q=self.Q, optimal_policy=self.optimal_policy,
+                                state_action_count=self.state_action_count,
+                                state_action_reward_sum=self.state_action_reward_sum,
+                                episode=episode, metadata=json.dumps(metadata))
+        os.rename(path + '.tmp', path)
+        return path
+
+    def load_learning(self, path):
+        """Restore Monte Carlo learning from a checkpoint written by save_learning.
+
+        optimal_policy is updated in place, so players holding it see the restored policy.
+
+        Args:
+            path (str): checkpoint file
+
+        Returns:
+            (tuple): episode number and metadata dict stored in the checkpoint
 
         """
-        np.savetxt('Q-%i.txt' % episode, self.Q, fmt='%.8f')
-        np.savetxt('optimal_policy-%i.txt' % episode, self.optimal_policy, fmt='%i')
-        np.savetxt('state_action_count-%i.txt' % episode, self.state_action_count, fmt='%i')
-        np.savetxt('state_action_reward_sum-%i.txt' % episode,
-                   self.state_action_reward_sum, fmt='%i')
+        with np.load(path) as checkpoint:
+            assert checkpoint['Q'].shape == self.Q.shape, \
+                'Checkpoint does not match the number of states and actions.'
+            self.Q[:] = checkpoint['Q']
+            self.optimal_policy[:] = checkpoint['optimal_policy']
+            self.state_action_count[:] = checkpoint['state_action_count']
+            self.state_action_reward_sum[:] = checkpoint['state_action_reward_sum']
+            return int(checkpoint['episode']), json.loads(str(checkpoint['metadata']))
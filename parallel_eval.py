@@ -0,0 +1,66 @@
+"""Multiprocess fitness evaluation of the (p1, p2) round-robin match grid."""
+from __future__ import division
+
+import multiprocessing
+
+import numpy as np
+
+import batch_game
+import bda
+
+
+def _play_shard(args):
+    """Play every game of one p1 row of the match grid (runs in a worker process)."""
+    genomes, p1_index, p2_agents, num_episodes, num_of_unique_cards, cards, hand_size, seed = args
+    population = bda.BDAPopulation.from_records(genomes)
+    p1_members, p2_members = batch_game.matchup_members([p1_index], p2_agents, num_episodes)
+    return batch_game.play_matchups(population, p1_members, p2_members, num_of_unique_cards,
+                                    cards, hand_size, np.random.RandomState(seed))
+
+
+class ParallelEvaluator(object):
+    """Shards the round-robin match grid across a process pool.
+
+    Each shard is one evolving player's row of the grid (all its random opponents, all
+    episodes). Shard k of the n-th evaluation deals its decks from RandomState([seed, n, k]),
+    so results depend only on the seed and the sequence of evaluations, never on the number of
+    worker processes.
+
+    Args:
+        processes (int): number of worker processes (defaults to the number of cores)
+        seed (int): base seed for dealing decks
+
+    Attributes:
+        seed (int): base seed for dealing decks
+        num_evaluations (int): number of round-robins evaluated so far
+
+    """
+
+    def __init__(self, processes=None, seed=0):
+        """Start the worker pool."""
+        self.seed = seed
+        self.num_evaluations = 0
+        self.pool = multiprocessing.Pool(processes)
+
+    def round_robin(self, population, pop_size, rand_pop_size, num_episodes, num_of_unique_cards,
+                    cards, hand_size):
+        """Parallel equivalent of batch_game.round_robin for a bda.BDAPopulation.
+
+        Returns:
+            (tuple): wins, losses, plus_minus, score_earned, score_diff arrays over all agents
+
+        """
+        genomes = population.to_records()
+        p2_agents = np.arange(pop_size, pop_size + rand_pop_size)
+        shards = [(genomes, p1_index, p2_agents, num_episodes, num_of_unique_cards, cards,
+                   hand_size, [self.seed, self.num_evaluations, p1_index])
+                  for p1_index in xrange(pop_size)]
+        self.num_evaluations += 1
+
+        results = self.pool.map(_play_shard, shards)
+        return tuple(np.sum(stats, axis=0) for stats in zip(*results))
+
+    def close(self):
+        """Shut down the worker pool."""
+        self.pool.close()
+        self.pool.join()
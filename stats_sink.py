@@ -0,0 +1,120 @@
+"""Buffered, columnar per-generation fitness statistics for a whole experiment.
+
+Every (run, generation, metric) summary is one fixed-width record; records are buffered in
+memory and appended in bulk to a single binary file per experiment, which load_stats reads
+back as one structured array. Confidence intervals are computed for all records at once.
+"""
+from __future__ import division
+
+import numpy as np
+import scipy.stats as st
+
+METRICS = ('win_percen', 'plus_minus', 'score_earned', 'score_diff')
+
+RECORD_DTYPE = np.dtype([('run', '<i4'), ('gen', '<i4'), ('metric', '<i4'), ('n', '<i4'),
+                         ('mean', '<f8'), ('std', '<f8'), ('sem', '<f8'), ('best', '<f8')])
+
+
+def fit_stats(run, gen, metric, fit):
+    """Return the summary record of one fitness array.
+
+    Args:
+        run (int): run index
+        gen (int): generation index
+        metric (str): name of the fitness measure (one of METRICS)
+        fit (array): fitness of every evolving agent
+
+    Returns:
+        (tuple): (run, gen, metric index, n, mean, std, sem, best)
+
+    """
+    fit = np.asarray(fit, dtype=float)
+    n = len(fit)
+    sem = np.std(fit, ddof=1) / np.sqrt(n) if n > 1 else np.nan
+    return (run, gen, METRICS.index(metric), n, np.mean(fit), np.std(fit), sem, np.amax(fit))
+
+
+class StatsSink(object):
+    """Buffers generation records and appends them in bulk to one binary file.
+
+    Args:
+        path (str): file to append records to (None keeps all records in memory)
+        buffer_size (int): number of buffered records that triggers a flush
+
+    Attributes:
+        buffer (list): records not yet flushed
+        num_flushed (int): number of records written to path
+
+    """
+
+    def __init__(self, path=None, buffer_size=10000):
+        """Initialize empty sink."""
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.num_flushed = 0
+
+    def record(self, run, gen, metric, fit):
+        """Buffer the summary of one fitness array."""
+        self.buffer.append(fit_stats(run, gen, metric, fit))
+        if self.path is not None and len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def extend(self, records):
+        """Buffer records produced elsewhere (e.g. by a worker's in-memory sink)."""
+        self.buffer.extend(records.tolist())
+        if self.path is not None and len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def records(self):
+        """Return buffered records as a structured array."""
+        return np.array(self.buffer, dtype=RECORD_DTYPE)
+
+    def flush(self):
+        """Append buffered records to path."""
+        if self.path is None or not self.buffer:
+            return
+        with open(self.path, 'ab') as stats_file:
+            self.records().tofile(stats_file)
+        self.num_flushed += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+def load_stats(path):
+    """Load all records of an experiment.
+
+    A run that was restarted appends its records again; only the last record of every
+    (run, gen, metric) is kept.
+
+    Returns:
+        (array): records sorted by run, metric and generation
+
+    """
+    records = np.fromfile(path, dtype=RECORD_DTYPE)[::-1]
+    keys = ((records['run'].astype(np.int64) * len(METRICS) + records['metric'])
+            * (records['gen'].max() + 1) + records['gen'])
+    _, last = np.unique(keys, return_index=True)
+    return records[last]
+
+
+def confidence_intervals(records, confidence=0.95):
+    """Return t-distribution confidence intervals of the mean of every record.
+
+    Returns:
+        (tuple): lower and upper bound arrays
+
+    """
+    half_width = st.t.ppf((1 + confidence) / 2, records['n'] - 1) * records['sem']
+    return records['mean'] - half_width, records['mean'] + half_width
+
+
+def metric_table(records, metric, field='mean'):
+    """Return a (num_runs, num_gens) array of one field of one metric's records."""
+    records = records[records['metric'] == METRICS.index(metric)]
+    runs = np.unique(records['run'])
+    table = np.full((len(runs), records['gen'].max() + 1), np.nan)
+    table[np.searchsorted(runs, records['run']), records['gen']] = records[field]
+    return table
@@ -0,0 +1,155 @@
+"""Sweep divide_dollar_bda.evolve over a grid or random sample of configurations.
+
+Every parameter takes a JSON list of values (--param NAME=JSON_LIST, NAME one of
+divide_dollar_bda.CONFIG_KEYS). The sweep evolves --runs runs of every combination (or of
+--random combinations drawn from them) across a process pool.
+
+Every configuration, completed with the defaults of the other settings, gets a directory named
+by its hash, holding config.json, its stats.bin (see stats_sink) and the per-run output files.
+Runs with a run-<i>.done checkpoint are skipped, so identical configurations are never evolved
+twice, within a sweep or across sweeps writing to the same output directory. Finally
+results.csv summarizes the last generation of every configuration in the output directory.
+
+Usage:
+    python sweep.py --param 'pop_size=[15,30]' --param 't_size=[5,11]' --runs 5 --output-dir sweep
+"""
+from __future__ import division
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+import divide_dollar_bda
+import experiment
+import stats_sink
+
+
+def config_hash(config):
+    """Return the directory name of a config (identical configs hash equally)."""
+    encoding = json.dumps(config, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(encoding.encode('ascii')).hexdigest()[:12]
+
+
+def parse_param(text):
+    """Parse NAME=JSON_LIST into (name, values)."""
+    name, _, values = text.partition('=')
+    if name not in divide_dollar_bda.CONFIG_KEYS:
+        raise argparse.ArgumentTypeError('unknown parameter %r' % name)
+    values = json.loads(values)
+    if not isinstance(values, list) or not values:
+        raise argparse.ArgumentTypeError('%s needs a non-empty JSON list of values' % name)
+    return name, values
+
+
+def grid_configs(space):
+    """Return every combination of the values in space ({name: values})."""
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*[space[n] for n in names])]
+
+
+def random_configs(space, num_configs, rng=np.random):
+    """Return num_configs distinct combinations drawn uniformly from space."""
+    grid = grid_configs(space)
+    chosen = rng.choice(len(grid), min(num_configs, len(grid)), replace=False)
+    return [grid[i] for i in sorted(chosen)]
+
+
+def config_dir(output_dir, config):
+    return os.path.join(output_dir, config_hash(config))
+
+
+def evolve_config(args):
+    """Evolve one run of one config (runs in a worker process)."""
+    config, run, seed, run_dir = args
+    experiment.seed_run(seed, run)
+    start = time.time()
+    records = divide_dollar_bda.evolve(config, run, run_dir)
+    return run_dir, run, records, time.time() - start
+
+
+def write_results(output_dir, path):
+    """Write one row per config in output_dir: its settings and last-generation statistics."""
+    rows = []
+    for name in sorted(os.listdir(output_dir)):
+        stats_path = os.path.join(output_dir, name, 'stats.bin')
+        if not os.path.exists(stats_path):
+            continue
+        with open(os.path.join(output_dir, name, 'config.json')) as config_file:
+            config = json.load(config_file)
+        records = stats_sink.load_stats(stats_path)
+        row = dict(config_hash=name, runs=len(np.unique(records['run'])))
+        row.update((key, json.dumps(value)) for key, value in config.items())
+        for metric in stats_sink.METRICS:
+            final = stats_sink.metric_table(records, metric)[:, -1]  # last generation of each run
+            final = final[~np.isnan(final)]
+            row[metric + '_mean'] = np.mean(final)
+            row[metric + '_sem'] = np.std(final, ddof=1) / np.sqrt(len(final)) if len(final) > 1 else np.nan
+            row[metric + '_best'] = np.amax(stats_sink.metric_table(records, metric, 'best')[:, -1])
+        rows.append(row)
+
+    keys = ['config_hash', 'runs'] + sorted(set(k for row in rows for k in row
+                                                 if k in divide_dollar_bda.CONFIG_KEYS))
+    keys += ['%s_%s' % (metric, field) for metric in stats_sink.METRICS
+             for field in ('mean', 'sem', 'best')]
+    with open(path, 'w') as results_file:
+        writer = csv.DictWriter(results_file, keys, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--param', type=parse_param, action='append', default=[],
+                        help='NAME=JSON_LIST of values to sweep (repeatable)')
+    parser.add_argument('--random', type=int, default=None,
+                        help='evolve this many random combinations instead of the full grid')
+    parser.add_argument('--runs', type=int, default=1, help='runs per configuration')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='base seed; run i of every config is seeded with (seed, i)')
+    parser.add_argument('--output-dir', default='sweep', help='directory of all configurations')
+    args = parser.parse_args()
+
+    space = dict(args.param)
+    if args.random is None:
+        configs = grid_configs(space)
+    else:
+        configs = random_configs(space, args.random, np.random.RandomState(args.seed))
+    # Complete every config with the current defaults, so its hash names all its settings
+    configs = [dict(divide_dollar_bda.current_config(), **config) for config in configs]
+    for config in configs:
+        try:
+            divide_dollar_bda.check_evaluation_modes(config)
+        except ValueError as error:
+            parser.error('%s in %s' % (error, json.dumps(config, sort_keys=True)))
+
+    jobs = []
+    sinks = {}
+    for config in configs:
+        run_dir = config_dir(args.output_dir, config)
+        if not os.path.isdir(run_dir):
+            os.makedirs(run_dir)
+        with open(os.path.join(run_dir, 'config.json'), 'w') as config_file:
+            json.dump(config, config_file, sort_keys=True)
+        sinks[run_dir] = stats_sink.StatsSink(os.path.join(run_dir, 'stats.bin'))
+        jobs += [(config, run, args.seed, run_dir)
+                 for run in experiment.pending_runs(run_dir, xrange(args.runs))]
+    print('%i configurations, %i runs to evolve' % (len(configs), len(jobs)))
+
+    start = time.time()
+    experiment.evolve_pool(evolve_config, jobs, args.processes, sinks)
+
+    write_results(args.output_dir, os.path.join(args.output_dir, 'results.csv'))
+    print('%.2f minutes' % ((time.time() - start) / 60))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Tests of the batched round-robins (run with pytest)."""
+from __future__ import division
+
+import numpy as np
+import pytest
+
+import batch_game
+import bda
+import divide_dollar_bda
+
+CARDS = [0.25, 0.50, 0.75]
+NUM_OF_UNIQUE_CARDS = [16, 28, 16]
+HAND_SIZE = 5
+
+
+def fixed_action_population(actions, rand_pop_size, rng):
+    """Return evolving agents that always take actions[i], followed by random agents.
+
+    No test of an agent ever passes (every threshold is above any input), so each decision
+    ends on the else-branch action after MAX_TRANSITIONS transitions.
+    """
+    population = bda.BDAPopulation(len(actions) + rand_pop_size, 8)
+    population.randomize(rng=rng)
+    for member, action in enumerate(actions):
+        population.decision_type[member] = 0
+        population.threshold[member] = 10.
+        population.actions[member, :, 1] = action
+    return population
+
+
+def test_play_games_matches_serial_play_game():
+    d = divide_dollar_bda
+    population = bda.BDAPopulation(10, d.bda_states)
+    population.randomize(rng=np.random.RandomState(0))
+    decks = batch_game.shuffled_decks(200, d.num_of_unique_cards, np.random.RandomState(1))
+    p1_members = np.arange(len(decks)) % 5
+    p2_members = 5 + np.arange(len(decks)) % 5
+
+    p1_scores, p2_scores = batch_game.play_games(
+        decks, batch_game.PopulationPolicy(population, p1_members),
+        batch_game.PopulationPolicy(population, p2_members), d.cards, d.hand_size)
+    bdas = [population.to_bda(i) for i in xrange(population.pop_size)]
+    serial = np.array([d.play_game(bdas[i], bdas[j], deck.tolist())
+                       for i, j, deck in zip(p1_members, p2_members, decks)])
+
+    assert np.allclose(p1_scores, serial[:, 0])
+    assert np.allclose(p2_scores, serial[:, 1])
+
+
+def test_adaptive_round_robin_selects_top_k_with_fewer_games():
+    # large_max wins ~54% of its games against random BDAs, small_spoil ~36%
+    actions = [2, 0, 0] * 3 + [2]
+    pop_size, rand_pop_size, num_episodes, top_k = len(actions), 25, 10, 4
+    population = fixed_action_population(actions, rand_pop_size, np.random.RandomState(0))
+    strongest = sorted(i for i, action in enumerate(actions) if action == 2)
+
+    wins = batch_game.round_robin(population, pop_size, rand_pop_size, num_episodes,
+                                  NUM_OF_UNIQUE_CARDS, CARDS, HAND_SIZE,
+                                  np.random.RandomState(0))[0]
+    adaptive = batch_game.adaptive_round_robin(population, pop_size, rand_pop_size, num_episodes,
+                                               2, num_episodes, top_k, NUM_OF_UNIQUE_CARDS,
+                                               CARDS, HAND_SIZE, rng=np.random.RandomState(0))
+    games = adaptive[-1]
+
+    assert sorted(np.argsort(-wins[:pop_size])[:top_k]) == strongest
+    assert sorted(np.argsort(-adaptive[0][:pop_size])[:top_k]) == strongest
+    assert games.sum() < pop_size * rand_pop_size * num_episodes
+    # every agent plays each opponent equally often, and statistics stay on the same scale
+    assert np.all(games == games[:, :1])
+    assert np.all(adaptive[0][:pop_size] <= rand_pop_size * num_episodes)
+
+
+def test_adaptive_round_robin_rejects_empty_steps():
+    population = fixed_action_population([2, 0], 5, np.random.RandomState(0))
+    with pytest.raises(ValueError):
+        batch_game.adaptive_round_robin(population, 2, 5, 4, 0, 4, 1, NUM_OF_UNIQUE_CARDS, CARDS,
+                                        HAND_SIZE)
+    with pytest.raises(ValueError):
+        divide_dollar_bda.resolve_config(dict(adaptive_episodes=4, min_episodes=0))
+
+
+def test_table_policy_matches_population_policy():
+    population = bda.BDAPopulation(40, 8)
+    population.randomize(rng=np.random.RandomState(1))
+    num_rounds = 1 + (sum(NUM_OF_UNIQUE_CARDS) - 2*HAND_SIZE)//2
+    fractions, fraction_class, actions, transitions = population.decision_tables(CARDS, num_rounds)
+    # one table entry per class of equivalent fractions, not per fraction
+    assert actions.shape[6] == fraction_class.max() + 1 < len(fractions)
+
+    members = np.random.RandomState(2).randint(0, 40, 5000)
+    decks = batch_game.shuffled_decks(len(members), NUM_OF_UNIQUE_CARDS, np.random.RandomState(3))
+    opponent = batch_game.PopulationPolicy(population, members[::-1])
+    table_scores = batch_game.play_games(
+        decks, batch_game.TablePolicy((fractions, fraction_class, actions, transitions), members, CARDS),
+        opponent, CARDS, HAND_SIZE)
+    opponent.current_states[:] = 0
+    scores = batch_game.play_games(decks, batch_game.PopulationPolicy(population, members),
+                                   opponent, CARDS, HAND_SIZE)
+    assert np.array_equal(table_scores[0], scores[0])
+    assert np.array_equal(table_scores[1], scores[1])
@@ -0,0 +1,45 @@
+"""Tests of the packed genome records (run with pytest)."""
+from __future__ import division
+
+import numpy as np
+import pytest
+
+import bda
+
+
+def random_population(pop_size=6, num_states=8, seed=0):
+    population = bda.BDAPopulation(pop_size, num_states)
+    population.randomize(rng=np.random.RandomState(seed))
+    return population
+
+
+def assert_same_genomes(population, other):
+    for field in ('decision_index', 'decision_type', 'threshold', 'actions', 'transitions'):
+        assert np.array_equal(getattr(population, field), getattr(other, field)), field
+
+
+def test_records_round_trip(tmp_path):
+    population = random_population()
+    assert_same_genomes(population, bda.BDAPopulation.from_records(population.to_records()))
+
+    path = str(tmp_path / 'pop.npy')
+    bda.save_population(path, population)
+    assert_same_genomes(population, bda.load_population(path))
+
+    # a single BDA packs to the same records as its population row
+    assert np.array_equal(population.to_bda(3).to_records(), population.to_records([3])[0])
+
+
+def test_records_reject_values_that_would_wrap():
+    population = random_population()
+    population.transitions[2, 0, 1] = population.num_states
+    with pytest.raises(AssertionError):
+        population.to_records()
+
+    population = random_population()
+    population.actions[0, 0, 0] = np.iinfo(np.int8).max + 1
+    with pytest.raises(AssertionError):
+        population.to_records()
+
+    with pytest.raises(AssertionError):
+        bda.check_genes([0], [0], [[0, 0]], [[0, 0]], bda.MAX_RECORD_STATES + 1)
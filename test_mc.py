@@ -0,0 +1,26 @@
+"""Tests of Monte Carlo learning (run with pytest)."""
+from __future__ import division
+
+import numpy as np
+
+from mc import MonteCarloLearning
+
+
+def test_update_batch_matches_sequential_updates():
+    rng = np.random.RandomState(0)
+    states = rng.randint(0, 40, 5000)
+    actions = rng.randint(0, 3, len(states))
+    rewards = rng.randint(-1, 2, len(states))
+
+    sequential = MonteCarloLearning(40, 3)
+    batch = MonteCarloLearning(40, 3)
+    batch.optimal_policy[:] = sequential.optimal_policy
+    for state_index, action_index, reward in zip(states, actions, rewards):
+        sequential.update(state_index, action_index, reward)
+    batch.update_batch(states[:1000], actions[:1000], rewards[:1000])
+    batch.update_batch(states[1000:], actions[1000:], rewards[1000:])
+
+    assert np.array_equal(batch.state_action_count, sequential.state_action_count)
+    assert np.array_equal(batch.state_action_reward_sum, sequential.state_action_reward_sum)
+    assert np.allclose(batch.Q, sequential.Q)
+    assert np.array_equal(batch.optimal_policy, sequential.optimal_policy)
@@ -0,0 +1,194 @@
+"""All-vs-all tournament between evolved BDAs and Monte Carlo policies.
+
+Every pair of players plays the same bank of shuffled decks (common random numbers) from both
+seats. The games of many pairs are played as one batch (see agents.MixedPolicy) and chunks of
+pairs are spread over a process pool; the deck bank only depends on the seed, so the results do
+not depend on the number of processes. The outcome is a win-rate matrix and Bradley-Terry
+strengths, reported on the Elo scale.
+
+Usage:
+    python tournament.py --bdas pop-0.npy hall_of_fame.npy --policies mc-2000000.npz \\
+        --games 100 --processes 8 --seed 1 --output-dir tournament
+"""
+from __future__ import division
+
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import agents
+import batch_game
+import divide_dollar_bda
+import game
+
+
+def play_pairs(args):
+    """Play every deck of the bank from both seats for a chunk of pairs (runs in a worker process).
+
+    Returns:
+        (tuple): pairs, and each pair's games won by its first and second player and summed
+            score difference of its first player
+
+    """
+    players, pairs, decks, cards, hand_size = args
+    num_games = len(decks)
+    first = np.repeat(pairs[:, 0], num_games)
+    second = np.repeat(pairs[:, 1], num_games)
+    p1_members = np.concatenate((first, second))
+    p2_members = np.concatenate((second, first))
+    p1_scores, p2_scores = batch_game.play_games(
+        np.tile(decks, (2 * len(pairs), 1)), agents.MixedPolicy(players, p1_members),
+        agents.MixedPolicy(players, p2_members), cards, hand_size)
+
+    # Fold both seatings back onto the pair's first player
+    first_scores = np.concatenate((p1_scores[:len(first)], p2_scores[len(first):]))
+    second_scores = np.concatenate((p2_scores[:len(first)], p1_scores[len(first):]))
+    shape = (len(pairs), 2 * num_games)
+    first_scores = first_scores.reshape(2, len(pairs), num_games).transpose(1, 0, 2).reshape(shape)
+    second_scores = second_scores.reshape(2, len(pairs), num_games).transpose(1, 0, 2).reshape(shape)
+    return (pairs, (first_scores > second_scores).sum(axis=1),
+            (second_scores > first_scores).sum(axis=1), (first_scores - second_scores).sum(axis=1))
+
+
+def tournament(players, num_games, num_of_unique_cards, cards, hand_size, seed=None, processes=1,
+               pairs_per_chunk=200):
+    """Play every pair of players on num_games shared decks from both seats.
+
+    Returns:
+        (tuple): (n, n) matrices of games player i won against player j, games they played and
+            player i's summed score difference against player j
+
+    """
+    players = agents.pool_bdas(players)
+    n = len(players)
+    decks = batch_game.shuffled_decks(num_games, num_of_unique_cards, np.random.RandomState(seed))
+    pairs = np.array([(i, j) for i in xrange(n) for j in xrange(i + 1, n)], dtype=np.int64)
+    chunks = [(players, pairs[k:k + pairs_per_chunk], decks, cards, hand_size)
+              for k in xrange(0, len(pairs), pairs_per_chunk)]
+
+    wins = np.zeros((n, n))
+    games = np.zeros((n, n))
+    score_diff = np.zeros((n, n))
+    if processes == 1:
+        results = map(play_pairs, chunks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(play_pairs, chunks)
+            pool.close()
+        finally:
+            pool.join()
+    for chunk_pairs, first_wins, second_wins, first_diff in results:
+        i, j = chunk_pairs.T
+        wins[i, j] = first_wins
+        wins[j, i] = second_wins
+        games[i, j] = games[j, i] = 2 * num_games
+        score_diff[i, j] = first_diff
+        score_diff[j, i] = -first_diff
+    return wins, games, score_diff
+
+
+def win_rates(wins, games):
+    """Return the matrix of win rates, ties counting half (nan where no games were played)."""
+    ties = games - wins - wins.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (wins + ties / 2) / games
+
+
+def bradley_terry(wins, games, iterations=1000, tolerance=1e-10):
+    """Return Bradley-Terry strengths fitted by minorization-maximization (ties count half).
+
+    Player i beats player j with probability strength[i] / (strength[i] + strength[j]). A
+    point of prior (half a win and half a loss against a virtual average player) keeps the
+    strengths of undefeated or winless players finite. Strengths are normalized to a geometric
+    mean of 1.
+    """
+    ties = games - wins - wins.T
+    score = (wins + ties / 2).sum(axis=1) + 0.5
+    strength = np.ones(len(wins))
+    for _ in xrange(iterations):
+        pairwise = games / (strength[:, None] + strength[None, :])
+        updated = score / (pairwise.sum(axis=1) + 1 / (strength + 1))
+        updated /= np.exp(np.mean(np.log(updated)))
+        converged = np.max(np.abs(updated - strength)) < tolerance
+        strength = updated
+        if converged:
+            break
+    return strength
+
+
+def elo_ratings(strength, base=1500):
+    """Return Bradley-Terry strengths on the Elo scale (400 points = 10:1 odds)."""
+    return base + 400 * np.log10(strength)
+
+
+def file_names(paths):
+    """Return a unique name for every input file: its path relative to their common directory.
+
+    Files with equal basenames (e.g. pop-0.npy of several runs) are told apart by their
+    directories.
+    """
+    dirs = [os.path.dirname(os.path.abspath(path)) + os.sep for path in paths]
+    root = os.path.commonprefix(dirs)
+    root = root[:root.rfind(os.sep) + 1]  # whole directory names only
+    return [os.path.relpath(os.path.abspath(path), root) for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--bdas', nargs='*', default=[],
+                        help='population, archive or hall-of-fame .npy files of BDAs')
+    parser.add_argument('--size', type=int, default=None, help='BDAs taken from each file')
+    parser.add_argument('--policies', nargs='*', default=[],
+                        help='mc.MonteCarloLearning checkpoints whose optimal_policy plays')
+    parser.add_argument('--games', type=int, default=100, help='shared decks per pair (x2 seats)')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the deck bank')
+    parser.add_argument('--output-dir', default='.', help='directory for the result tables')
+    args = parser.parse_args()
+
+    d = divide_dollar_bda
+    card_game = game.CardGame(game.Deck(dict(zip(d.cards, d.num_of_unique_cards))), d.num_players,
+                              sorted(d.actions, key=d.actions.get), d.hand_size)
+    file_name = dict(zip(args.bdas + args.policies, file_names(args.bdas + args.policies)))
+    names = []
+    players = []
+    for path in args.bdas:
+        bdas = agents.load_bdas(path, args.size)
+        names += ['%s:%i' % (file_name[path], i) for i in xrange(len(bdas))]
+        players += bdas
+    for path in args.policies:
+        names.append(file_name[path])
+        players.append(agents.load_policy(path, card_game))
+    print('%i players, %i pairs' % (len(players), len(players) * (len(players) - 1) // 2))
+
+    start = time.time()
+    wins, games, score_diff = tournament(players, args.games, d.num_of_unique_cards, d.cards,
+                                         d.hand_size, args.seed, args.processes)
+    rates = win_rates(wins, games)
+    points = wins + (games - wins - wins.T) / 2
+    ratings = elo_ratings(bradley_terry(wins, games))
+
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    with open(os.path.join(args.output_dir, 'win_rates.csv'), 'w') as rates_file:
+        writer = csv.writer(rates_file)
+        writer.writerow([''] + names)
+        for name, row in zip(names, rates):
+            writer.writerow([name] + ['' if np.isnan(rate) else '%.4f' % rate for rate in row])
+    with open(os.path.join(args.output_dir, 'ratings.csv'), 'w') as ratings_file:
+        writer = csv.writer(ratings_file)
+        writer.writerow(['rank', 'player', 'elo', 'win_rate', 'mean_score_diff', 'games'])
+        for rank, i in enumerate(np.argsort(-ratings)):
+            played = games[i].sum()
+            writer.writerow([rank + 1, names[i], '%.1f' % ratings[i], '%.4f' % (points[i].sum() / played),
+                             '%.3f' % (score_diff[i].sum() / played), int(played)])
+    print('%.2f minutes' % ((time.time() - start) / 60))
+
+
+if __name__ == '__main__':
+    main()